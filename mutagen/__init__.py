@@ -20,7 +20,7 @@ depending on tag or format. They may also be entirely different objects
 for certain keys, again depending on format.
 """
 
-from mutagen._util import MutagenError
+from mutagen._util import MutagenError, set_save_strategy, set_io_tracer
 from mutagen._file import FileType, StreamInfo, File
 from mutagen._tags import Tags, Metadata, PaddingInfo
 
@@ -32,6 +32,10 @@ version_string = ".".join(map(str, version))
 
 MutagenError
 
+set_save_strategy
+
+set_io_tracer
+
 FileType
 
 StreamInfo
@@ -31,6 +31,9 @@ class FileType(DictMixin):
     Attributes:
         info (`StreamInfo`): contains length, bitrate, sample rate
         tags (`Tags`): metadata tags, if any, otherwise `None`
+        io_stats (`mutagen._util.IOStats`): the file operations of the last
+            load, save or delete if an I/O tracer was set for it, see
+            `mutagen.set_io_tracer`, otherwise `None`
     """
 
     __module__ = "mutagen"
@@ -38,6 +41,7 @@ class FileType(DictMixin):
     info = None
     tags = None
     filename = None
+    io_stats = None
     _mimes = ["application/octet-stream"]
 
     def __init__(self, *args, **kwargs):
@@ -50,20 +50,15 @@ def main(argv):
                 fileobjs["m3u"] = m3u
             else:
                 m3u = None
-            while True:
-                try:
-                    page = OggPage(fileobj)
-                except EOFError:
-                    break
-                else:
-                    format["stream"] = page.serial
-                    if page.serial not in fileobjs:
-                        new_filename = options.pattern % format
-                        new_fileobj = open(new_filename, "wb")
-                        fileobjs[page.serial] = new_fileobj
-                        if m3u:
-                            m3u.write(new_filename + "\r\n")
-                    fileobjs[page.serial].write(page.write())
+            for page in OggPage.iter_pages(fileobj):
+                format["stream"] = page.serial
+                if page.serial not in fileobjs:
+                    new_filename = options.pattern % format
+                    new_fileobj = open(new_filename, "wb")
+                    fileobjs[page.serial] = new_fileobj
+                    if m3u:
+                        m3u.write(new_filename + "\r\n")
+                fileobjs[page.serial].write(page.write())
             for f in fileobjs.values():
                 f.close()
 
@@ -12,17 +12,21 @@ You should not rely on the interfaces here being stable. They are
 intended for internal use in Mutagen only.
 """
 
+import os
 import sys
 import struct
 import codecs
 import errno
+import shutil
+import tempfile
 
 try:
     import mmap
 except:
     pass
 
-from collections import namedtuple
+from bisect import bisect_right
+from collections import namedtuple, OrderedDict
 from contextlib import contextmanager
 from functools import wraps
 from fnmatch import fnmatchcase
@@ -97,7 +101,7 @@ def fileobj_name(fileobj):
     return value
 
 
-def loadfile(method=True, writable=False, create=False):
+def loadfile(method=True, writable=False, create=False, cached=False):
     """A decorator for functions taking a `filething` as a first argument.
 
     Passes a FileThing instance as the first argument to the wrapped function.
@@ -108,30 +112,38 @@ def loadfile(method=True, writable=False, create=False):
             passed a file object verifies that it is writable.
         create (bool): If passed a filename that does not exist will create
             a new empty file.
+        cached (bool): If passed a filename and not writable, reads go
+            through a block cache (see `_CachedFileObject`), which only
+            supports read(), seek() and tell().
     """
 
     def convert_file_args(args, kwargs):
         filething = args[0] if args else None
         filename = kwargs.pop("filename", None)
         fileobj = kwargs.pop("fileobj", None)
-        return filething, filename, fileobj, args[1:], kwargs
+        if writable:
+            kwargs = dict(kwargs)
+            strategy = kwargs.pop("strategy", None)
+        else:
+            strategy = None
+        return filething, filename, fileobj, strategy, args[1:], kwargs
 
     def wrap(func):
 
         @wraps(func)
         def wrapper(self, *args, **kwargs):
-            filething, filename, fileobj, args, kwargs = \
+            filething, filename, fileobj, strategy, args, kwargs = \
                 convert_file_args(args, kwargs)
             with _openfile(self, filething, filename, fileobj,
-                           writable, create) as h:
+                           writable, create, strategy, cached) as h:
                 return func(self, h, *args, **kwargs)
 
         @wraps(func)
         def wrapper_func(*args, **kwargs):
-            filething, filename, fileobj, args, kwargs = \
+            filething, filename, fileobj, strategy, args, kwargs = \
                 convert_file_args(args, kwargs)
             with _openfile(None, filething, filename, fileobj,
-                           writable, create) as h:
+                           writable, create, strategy, cached) as h:
                 return func(h, *args, **kwargs)
 
         return wrapper if method else wrapper_func
@@ -170,8 +182,214 @@ can be used for file type detection
 """
 
 
+_SAVE_STRATEGIES = ("inplace", "rewrite", "auto")
+
+_save_strategy = ("inplace", 2 ** 24)
+"""The global (strategy, threshold) used for writing files"""
+
+
+def set_save_strategy(strategy, threshold=2 ** 24):
+    """Sets how files get changed when saving, if not passed to the save
+    or delete method using the ``strategy`` keyword argument.
+
+    Args:
+        strategy (str): one of
+
+            * ``"inplace"``: change the file directly (the default)
+            * ``"rewrite"``: collect all changes first and then write the
+              new file content to a temporary file in the same directory,
+              which then replaces the original file. Loading the file
+              while this is in progress gives the old or the new content,
+              but no mix of both. Since this creates a new file, hard
+              links are not preserved and the file gets the owner of the
+              writing process. If a file object is passed instead of a
+              file name, the changes are written to it directly.
+            * ``"auto"``: like ``"rewrite"``, but only rewrite the file if
+              changing it in place would move more than `threshold` bytes
+        threshold (int): see ``"auto"``
+    Raises:
+        ValueError: in case of an unknown strategy
+    """
+
+    global _save_strategy
+
+    if strategy not in _SAVE_STRATEGIES:
+        raise ValueError("unknown save strategy %r" % strategy)
+    _save_strategy = (strategy, threshold)
+
+
+_io_tracer = None
+"""The function passed to set_io_tracer() or None"""
+
+
+def set_io_tracer(callback):
+    """Sets a function which gets called for every operation on the file
+    while loading, saving or deleting, or `None` to disable tracing (the
+    default).
+
+    It gets passed the name of the file, the operation (``"read"``,
+    ``"write"``, ``"seek"`` or ``"truncate"``), the file offset and the
+    number of bytes read or written. For seek and truncate the offset is
+    the new position or size and the number of bytes is zero.
+
+    While tracing is enabled `FileType.io_stats` gets set to an `IOStats`
+    instance as well. Data moved using mmap or os.copy_file_range() is
+    not included.
+
+    Args:
+        callback (callable): ``callback(name, operation, offset, size)``
+            or `None`
+    """
+
+    global _io_tracer
+
+    _io_tracer = callback
+
+
+class IOStats(object):
+    """The number of operations and bytes read and written while loading
+    or saving a file with an I/O tracer set, see `set_io_tracer`.
+
+    Attributes:
+        reads (int): number of read calls
+        read_bytes (int): number of bytes read
+        writes (int): number of write calls
+        write_bytes (int): number of bytes written
+        seeks (int): number of seek calls
+        truncates (int): number of truncate calls
+    """
+
+    def __init__(self):
+        self.reads = 0
+        self.read_bytes = 0
+        self.writes = 0
+        self.write_bytes = 0
+        self.seeks = 0
+        self.truncates = 0
+
+    def __repr__(self):
+        return "<%s reads=%d read_bytes=%d writes=%d write_bytes=%d " \
+            "seeks=%d truncates=%d>" % (
+                type(self).__name__, self.reads, self.read_bytes,
+                self.writes, self.write_bytes, self.seeks, self.truncates)
+
+
+class _TracedFileObject(object):
+    """Wraps a file object, counts all operations in `stats` and passes
+    them to `callback`.
+    """
+
+    def __init__(self, fileobj, name, callback):
+        self._fileobj = fileobj
+        self._name = name
+        self._callback = callback
+        self.stats = IOStats()
+
+    @property
+    def name(self):
+        return self._fileobj.name
+
+    def fileno(self):
+        return self._fileobj.fileno()
+
+    def tell(self):
+        return self._fileobj.tell()
+
+    def flush(self):
+        self._fileobj.flush()
+
+    def close(self):
+        self._fileobj.close()
+
+    def seek(self, offset, whence=0):
+        result = self._fileobj.seek(offset, whence)
+        self.stats.seeks += 1
+        self._callback(self._name, "seek", self._fileobj.tell(), 0)
+        return result
+
+    def read(self, size=-1):
+        offset = self._fileobj.tell()
+        data = self._fileobj.read(size)
+        self.stats.reads += 1
+        self.stats.read_bytes += len(data)
+        self._callback(self._name, "read", offset, len(data))
+        return data
+
+    def write(self, data):
+        offset = self._fileobj.tell()
+        result = self._fileobj.write(data)
+        self.stats.writes += 1
+        self.stats.write_bytes += len(data)
+        self._callback(self._name, "write", offset, len(data))
+        return result
+
+    def truncate(self, size=None):
+        if size is None:
+            size = self._fileobj.tell()
+        result = self._fileobj.truncate(size)
+        self.stats.truncates += 1
+        self._callback(self._name, "truncate", size, 0)
+        return result
+
+
+def _trace_fileobj(instance, fileobj, name):
+    """Wraps fileobj if an I/O tracer is set and attaches the IOStats to
+    instance if it supports them, or resets them to None if no tracer is
+    set. Returns the file object to use.
+    """
+
+    callback = _io_tracer
+    if callback is None:
+        if getattr(instance, "io_stats", None) is not None:
+            instance.io_stats = None
+        return fileobj
+
+    traced = fileobj
+    while traced is not None and not isinstance(traced, _TracedFileObject):
+        # in case of stacked calls the outer one has wrapped it already
+        traced = getattr(traced, "_fileobj", None)
+    if traced is None:
+        traced = fileobj = _TracedFileObject(fileobj, name, callback)
+
+    if hasattr(instance, "io_stats"):
+        instance.io_stats = traced.stats
+    return fileobj
+
+
 @contextmanager
-def _openfile(instance, filething, filename, fileobj, writable, create):
+def _apply_save_strategy(fileobj, filename, strategy):
+    """Yields the file object to write to according to the strategy and
+    carries out the changes in the end.
+    """
+
+    default, threshold = _save_strategy
+    if strategy is None:
+        strategy = default
+    elif strategy not in _SAVE_STRATEGIES:
+        raise ValueError("unknown save strategy %r" % strategy)
+
+    if strategy == "inplace":
+        yield fileobj
+        return
+
+    try:
+        edit = _EditFile(fileobj)
+    except (IOError, OSError) as e:
+        reraise(MutagenError, e, sys.exc_info()[2])
+    yield edit
+    try:
+        if filename is not None and (
+                strategy == "rewrite" or edit._moved > threshold):
+            edit._rewrite(filename)
+        else:
+            edit._apply()
+    except (IOError, OSError) as e:
+        reraise(MutagenError, e, sys.exc_info()[2])
+
+
+@contextmanager
+def _openfile(instance, filething, filename, fileobj, writable, create,
+              strategy=None, cached=False):
     """yields a FileThing
 
     Args:
@@ -181,6 +399,10 @@ def _openfile(instance, filething, filename, fileobj, writable, create):
         writable (bool): if the file should be opened
         create (bool): if the file should be created if it doesn't exist.
             implies writable
+        strategy: the save strategy to use if writable, see
+            set_save_strategy(), or None for the default
+        cached (bool): if a file opened read-only from a filename should
+            be wrapped in a `_CachedFileObject`
     Raises:
         MutagenError: In case opening the file failed
         TypeError: in case neither a file name or a file object is passed
@@ -193,6 +415,10 @@ def _openfile(instance, filething, filename, fileobj, writable, create):
         filename = filething.filename
         fileobj = filething.fileobj
         filething = None
+        # the outer one takes care of the save strategy
+        edit = False
+    else:
+        edit = writable
 
     if filething is not None:
         if is_fileobj(filething):
@@ -209,7 +435,13 @@ def _openfile(instance, filething, filename, fileobj, writable, create):
 
     if fileobj is not None:
         verify_fileobj(fileobj, writable=writable)
-        yield FileThing(fileobj, filename, filename or fileobj_name(fileobj))
+        name = filename or fileobj_name(fileobj)
+        fileobj = _trace_fileobj(instance, fileobj, name)
+        if edit:
+            with _apply_save_strategy(fileobj, None, strategy) as fileobj:
+                yield FileThing(fileobj, filename, name)
+        else:
+            yield FileThing(fileobj, filename, name)
     elif filename is not None:
         verify_filename(filename)
         try:
@@ -225,7 +457,15 @@ def _openfile(instance, filething, filename, fileobj, writable, create):
                 raise MutagenError(e)
 
         with fileobj as fileobj:
-            yield FileThing(fileobj, filename, filename)
+            fileobj = _trace_fileobj(instance, fileobj, filename)
+            if edit:
+                with _apply_save_strategy(
+                        fileobj, filename, strategy) as fileobj:
+                    yield FileThing(fileobj, filename, filename)
+            else:
+                if cached:
+                    fileobj = _CachedFileObject(fileobj)
+                yield FileThing(fileobj, filename, filename)
     else:
         raise TypeError("Missing filename or fileobj argument")
 
@@ -766,12 +1006,147 @@ def fallback_move(fobj, dest, src, count, BUFFER_SIZE=2 ** 16):
         fobj.flush()
 
 
+_FALLOC_FL_COLLAPSE_RANGE = 0x08
+_FALLOC_FL_INSERT_RANGE = 0x20
+
+
+def _get_fallocate():
+    """Returns the Linux fallocate() function or None"""
+
+    if not sys.platform.startswith("linux"):
+        return
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        func = getattr(libc, "fallocate64", None) or libc.fallocate
+    except (ImportError, OSError, AttributeError):
+        return
+    func.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64,
+                     ctypes.c_int64]
+    func.restype = ctypes.c_int
+    return func
+
+
+_fallocate = None
+
+
+def fallocate_range(fobj, offset, size, collapse=False):
+    """Inserts or removes a range of the file using fallocate() and
+    FALLOC_FL_INSERT_RANGE or FALLOC_FL_COLLAPSE_RANGE, which only changes
+    the file system extents instead of moving the data after it.
+
+    This only works on Linux, with some file systems and if offset and
+    size are multiples of the file system block size. Inserted space
+    reads as zeros.
+
+    Args:
+        fobj (fileobj)
+        offset (int): The start of the range
+        size (int): The size of the range
+        collapse (bool): Remove the range instead of inserting it
+    Returns:
+        bool: If the file was changed
+    """
+
+    global _fallocate
+
+    if size <= 0 or not sys.platform.startswith("linux"):
+        return False
+
+    try:
+        fileno = fobj.fileno()
+        blocksize = os.fstat(fileno).st_blksize
+    except (AttributeError, IOError, OSError, ValueError):
+        return False
+
+    if not blocksize or offset % blocksize or size % blocksize:
+        return False
+
+    if _fallocate is None:
+        _fallocate = _get_fallocate() or False
+    if not _fallocate:
+        return False
+
+    if collapse:
+        mode = _FALLOC_FL_COLLAPSE_RANGE
+    else:
+        mode = _FALLOC_FL_INSERT_RANGE
+    fobj.flush()
+    return _fallocate(fileno, mode, offset, size) == 0
+
+
+def copy_range_move(fobj, dest, src, count, MIN_STEP=2 ** 20):
+    """Moves data in the kernel using os.copy_file_range(), in steps
+    which don't overlap. Only used if source and destination are at least
+    MIN_STEP apart, to keep the number of calls low.
+
+    Gives up on the first error. In case src > dest data gets moved
+    from the start of the area, otherwise from the end of it.
+
+    Args:
+        fobj (fileobj)
+        dest (int): The destination offset
+        src (int): The source offset
+        count (int) The amount of data to move
+    Returns:
+        int: The amount of data moved
+    """
+
+    copy_file_range = getattr(os, "copy_file_range", None)
+    step = abs(dest - src)
+    if copy_file_range is None or not count or step < MIN_STEP:
+        return 0
+
+    try:
+        fileno = fobj.fileno()
+    except (AttributeError, IOError, ValueError):
+        return 0
+
+    fobj.flush()
+    moved = 0
+    try:
+        while moved < count:
+            size = min(step, count - moved)
+            if src > dest:
+                start = moved
+            else:
+                start = count - moved - size
+            done = 0
+            while done < size:
+                result = copy_file_range(
+                    fileno, fileno, size - done,
+                    src + start + done, dest + start + done)
+                if result <= 0:
+                    return moved
+                done += result
+            moved += size
+    except OSError:
+        pass
+    return moved
+
+
+def _move(fobj, dest, src, count, BUFFER_SIZE):
+    """Moves data using the fastest method available"""
+
+    moved = copy_range_move(fobj, dest, src, count)
+    if src > dest:
+        dest += moved
+        src += moved
+    count -= moved
+
+    try:
+        mmap_move(fobj, dest, src, count)
+    except mmap.error:
+        fallback_move(fobj, dest, src, count, BUFFER_SIZE)
+
+
 def insert_bytes(fobj, size, offset, BUFFER_SIZE=2 ** 16):
     """Insert size bytes of empty space starting at offset.
 
     fobj must be an open file object, open rb+ or
-    equivalent. Mutagen tries to use mmap to resize the file, but
-    falls back to a significantly slower method if mmap fails.
+    equivalent. Mutagen tries to insert the space using fallocate() or
+    to move the data with copy_file_range() or mmap, but falls back to a
+    significantly slower method if those fail.
 
     Args:
         fobj (fileobj)
@@ -791,20 +1166,24 @@ def insert_bytes(fobj, size, offset, BUFFER_SIZE=2 ** 16):
     if movesize < 0:
         raise ValueError
 
-    resize_file(fobj, size, BUFFER_SIZE)
+    if isinstance(fobj, _EditFile):
+        fobj._insert(size, offset)
+        return
 
-    try:
-        mmap_move(fobj, offset + size, offset, movesize)
-    except mmap.error:
-        fallback_move(fobj, offset + size, offset, movesize, BUFFER_SIZE)
+    if movesize and fallocate_range(fobj, offset, size):
+        return
+
+    resize_file(fobj, size, BUFFER_SIZE)
+    _move(fobj, offset + size, offset, movesize, BUFFER_SIZE)
 
 
 def delete_bytes(fobj, size, offset, BUFFER_SIZE=2 ** 16):
     """Delete size bytes of empty space starting at offset.
 
     fobj must be an open file object, open rb+ or
-    equivalent. Mutagen tries to use mmap to resize the file, but
-    falls back to a significantly slower method if mmap fails.
+    equivalent. Mutagen tries to remove the space using fallocate() or
+    to move the data with copy_file_range() or mmap, but falls back to a
+    significantly slower method if those fail.
 
     Args:
         fobj (fileobj)
@@ -824,11 +1203,14 @@ def delete_bytes(fobj, size, offset, BUFFER_SIZE=2 ** 16):
     if movesize < 0:
         raise ValueError
 
-    try:
-        mmap_move(fobj, offset, offset + size, movesize)
-    except mmap.error:
-        fallback_move(fobj, offset, offset + size, movesize, BUFFER_SIZE)
+    if isinstance(fobj, _EditFile):
+        fobj._delete(size, offset)
+        return
 
+    if movesize and fallocate_range(fobj, offset, size, collapse=True):
+        return
+
+    _move(fobj, offset, offset + size, movesize, BUFFER_SIZE)
     resize_file(fobj, -size, BUFFER_SIZE)
 
 
@@ -855,6 +1237,523 @@ def resize_bytes(fobj, old_size, new_size, offset):
         insert_bytes(fobj, insert_size, insert_at)
 
 
+class EditPlan(object):
+    """Collects changes to a file and carries them out at once.
+
+    All offsets refer to the file content before any of the changes, so
+    they stay valid no matter how earlier changes affect the file size.
+    On apply() the unchanged data in between gets moved to its new
+    location in one pass, so each byte is moved at most once, compared
+    to once per resize_bytes() call before it.
+
+    Changes are not allowed to overlap. Insertions at the same offset end
+    up in the order they were added, in front of any other change there.
+
+    Args:
+        fileobj (fileobj): The file to change, opened r+b or equivalent
+    """
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._edits = []
+
+    def replace(self, offset, size, data):
+        """Replace `size` bytes at `offset` with `data`.
+
+        Args:
+            offset (int): The start of the area
+            size (int): The size of the area
+            data (bytes): The new content, can have any size
+        Raises:
+            ValueError
+        """
+
+        if offset < 0 or size < 0:
+            raise ValueError("Invalid parameters")
+        self._add(offset, size, len(data), bytes(data))
+
+    def write(self, offset, data):
+        """Overwrite the file content at `offset` with `data`"""
+
+        self.replace(offset, len(data), data)
+
+    def insert(self, offset, data):
+        """Insert `data` at `offset`"""
+
+        self.replace(offset, 0, data)
+
+    def delete(self, offset, size):
+        """Delete `size` bytes starting at `offset`"""
+
+        self.replace(offset, size, b"")
+
+    def resize(self, offset, old_size, new_size):
+        """Resize an area adding and deleting at the end of it, like
+        resize_bytes(). New space is filled with zeros.
+        """
+
+        if offset < 0 or old_size < 0 or new_size < 0:
+            raise ValueError("Invalid parameters")
+        if new_size < old_size:
+            self.delete(offset + new_size, old_size - new_size)
+        elif new_size > old_size:
+            self._add(offset + old_size, 0, new_size - old_size, None)
+
+    def _add(self, offset, size, new_size, data):
+        if size or new_size:
+            self._edits.append((offset, size, new_size, data))
+
+    def _sorted(self, filesize):
+        """Returns the edits sorted by offset or raises ValueError in case
+        they overlap or are outside of the file.
+        """
+
+        edits = sorted(self._edits, key=lambda e: (e[0], e[1] != 0))
+        end = 0
+        for offset, size, new_size, data in edits:
+            if offset < end:
+                raise ValueError("overlapping changes")
+            end = offset + size
+        if end > filesize:
+            raise ValueError("area outside of file")
+        return edits
+
+    def _write(self, offset, size, data):
+        fobj = self._fileobj
+        fobj.seek(offset)
+        if data is None:
+            while size:
+                fobj.write(b"\x00" * min(size, 2 ** 16))
+                size -= min(size, 2 ** 16)
+        else:
+            fobj.write(data)
+
+    def apply(self, BUFFER_SIZE=2 ** 16):
+        """Carries out all changes and resets the plan.
+
+        Raises:
+            IOError
+            ValueError: In case changes overlap or are outside of the file
+        """
+
+        fobj = self._fileobj
+        filesize = get_size(fobj)
+        edits = self._sorted(filesize)
+        del self._edits[:]
+
+        resizes = [e for e in edits if e[1] != e[2]]
+        if len(resizes) <= 1 or isinstance(fobj, _EditFile):
+            # Nothing gets moved more than once anyway (or nothing at all),
+            # so let resize_bytes() use its fast paths. Going backwards
+            # keeps the offsets of the remaining changes valid.
+            for offset, size, new_size, data in reversed(edits):
+                resize_bytes(fobj, size, new_size, offset)
+                self._write(offset, new_size, data)
+            fobj.flush()
+            return
+
+        # The unchanged areas in between with their shift in position
+        moves = []
+        shift = 0
+        for i, (offset, size, new_size, data) in enumerate(edits):
+            start = offset + size
+            shift += new_size - size
+            if i + 1 < len(edits):
+                end = edits[i + 1][0]
+            else:
+                end = filesize
+            if shift and end > start:
+                moves.append((start + shift, start, end - start))
+
+        if shift > 0:
+            resize_file(fobj, shift, BUFFER_SIZE)
+
+        # Moving data to the front has to start with the first area and
+        # moving to the back with the last one, so nothing gets overwritten
+        # before it was moved.
+        for dest, src, count in moves:
+            if dest < src:
+                _move(fobj, dest, src, count, BUFFER_SIZE)
+        for dest, src, count in reversed(moves):
+            if dest > src:
+                _move(fobj, dest, src, count, BUFFER_SIZE)
+
+        shift = 0
+        for offset, size, new_size, data in edits:
+            self._write(offset + shift, new_size, data)
+            shift += new_size - size
+
+        if shift < 0:
+            resize_file(fobj, shift, BUFFER_SIZE)
+        fobj.flush()
+
+
+def _copy_range(src, dest, offset, size, BUFFER_SIZE=2 ** 20):
+    """Appends `size` bytes starting at `offset` in `src` to `dest`.
+    Uses os.copy_file_range() if possible, which can share the data
+    blocks on some file systems.
+
+    Both files get flushed before copying between their file descriptors.
+    """
+
+    copy_file_range = getattr(os, "copy_file_range", None)
+    if copy_file_range is not None:
+        try:
+            src_fileno = src.fileno()
+            dest_fileno = dest.fileno()
+            src.flush()
+            dest.flush()
+            while size:
+                done = copy_file_range(
+                    src_fileno, dest_fileno, size, offset)
+                if done <= 0:
+                    break
+                offset += done
+                size -= done
+        except (AttributeError, IOError, OSError, ValueError):
+            pass
+
+    while size:
+        src.seek(offset)
+        data = src.read(min(size, BUFFER_SIZE))
+        if not data:
+            raise IOError("file got shorter while writing")
+        dest.write(data)
+        offset += len(data)
+        size -= len(data)
+
+
+class _FileObjectWrapper(object):
+    """Base class for file-like objects which wrap a file object and keep
+    track of their own position and size.
+
+    The size is taken from the wrapped file when first needed. Subclasses
+    changing the content set `_size` to the new size, or to None if it
+    has to be looked up again.
+    """
+
+    def __init__(self, fileobj, pos=0):
+        self._fileobj = fileobj
+        self._pos = pos
+        self._size = None
+
+    @property
+    def name(self):
+        return self._fileobj.name
+
+    def tell(self):
+        return self._pos
+
+    def _get_size(self):
+        if self._size is None:
+            self._fileobj.seek(0, 2)
+            self._size = self._fileobj.tell()
+        return self._size
+
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            pos = offset
+        elif whence == 1:
+            pos = self._pos + offset
+        elif whence == 2:
+            pos = self._get_size() + offset
+        else:
+            raise ValueError("invalid whence (%r)" % whence)
+        if pos < 0:
+            raise IOError(errno.EINVAL, "negative seek position")
+        self._pos = pos
+        return pos
+
+
+class _CachedFileObject(_FileObjectWrapper):
+    """Wraps a file object and serves small reads from a cache of aligned
+    blocks, so parsers doing many small reads and seeks (usually at the
+    start and the end of the file) only need a few system calls.
+
+    The least recently used block gets dropped once there are more than
+    MAX_BLOCKS. Reads of at least BLOCK_SIZE go to the file directly.
+    Writes go to the file as well and drop the blocks they overlap.
+    """
+
+    BLOCK_SIZE = 2 ** 15
+    MAX_BLOCKS = 8
+
+    def __init__(self, fileobj, block_size=None):
+        super(_CachedFileObject, self).__init__(fileobj, fileobj.tell())
+        if block_size is not None:
+            self.BLOCK_SIZE = block_size
+        # block index -> data, the last one is the most recently used
+        self._blocks = OrderedDict()
+
+    def fileno(self):
+        return self._fileobj.fileno()
+
+    def _get_block(self, index):
+        blocks = self._blocks
+        try:
+            data = blocks.pop(index)
+        except KeyError:
+            self._fileobj.seek(index * self.BLOCK_SIZE)
+            data = self._fileobj.read(self.BLOCK_SIZE)
+            if len(blocks) >= self.MAX_BLOCKS:
+                blocks.popitem(last=False)
+        blocks[index] = data
+        return data
+
+    def read(self, size=-1):
+        if size < 0 or size >= self.BLOCK_SIZE:
+            self._fileobj.seek(self._pos)
+            data = self._fileobj.read(size)
+            self._pos += len(data)
+            return data
+
+        parts = []
+        while size > 0:
+            index, start = divmod(self._pos, self.BLOCK_SIZE)
+            data = self._get_block(index)[start:start + size]
+            if not data:
+                break
+            parts.append(data)
+            self._pos += len(data)
+            size -= len(data)
+        return b"".join(parts)
+
+    def _invalidate(self, start, end):
+        first = start // self.BLOCK_SIZE
+        for index in list(self._blocks):
+            if index >= first and index * self.BLOCK_SIZE < end:
+                del self._blocks[index]
+        self._size = None
+
+    def write(self, data):
+        self._fileobj.seek(self._pos)
+        self._fileobj.write(data)
+        self._invalidate(self._pos, self._pos + len(data))
+        self._pos += len(data)
+
+    def truncate(self, size=None):
+        if size is None:
+            size = self._pos
+        self._fileobj.truncate(size)
+        self._invalidate(size, float("inf"))
+
+    def flush(self):
+        self._fileobj.flush()
+
+
+def _cache_fileobj(fileobj, block_size=None):
+    """Returns fileobj wrapped in a `_CachedFileObject`, or fileobj itself
+    if it is one already and uses the same block size.
+    """
+
+    if isinstance(fileobj, _CachedFileObject) and \
+            block_size in (None, fileobj.BLOCK_SIZE):
+        return fileobj
+    return _CachedFileObject(fileobj, block_size)
+
+
+class _EditFile(_FileObjectWrapper):
+    """A file-like object wrapping a file, which keeps all changes in
+    memory until they get applied to the file or a new file is written.
+
+    The content is a list of segments, each (size, source) with source
+    being either an offset in the original file, the data itself or None
+    for zeros. The start offsets of the segments are kept in a second,
+    sorted list so positions can be looked up with bisect.
+    """
+
+    def __init__(self, fileobj):
+        super(_EditFile, self).__init__(fileobj)
+        self._size = get_size(fileobj)
+        self._orig_size = self._size
+        self._segments = [(self._size, 0)] if self._size else []
+        self._starts = [0] if self._size else []
+        self._changed = False
+        self._moved = 0
+        """bytes which would have been moved changing the file in place"""
+
+    def flush(self):
+        pass
+
+    def _split(self, offset):
+        """Makes sure a segment starts at offset and returns its index"""
+
+        segments = self._segments
+        starts = self._starts
+        i = bisect_right(starts, offset) - 1
+        if i >= 0:
+            pos = starts[i]
+            size, source = segments[i]
+            if pos == offset:
+                return i
+            if offset < pos + size:
+                cut = offset - pos
+                if source is None:
+                    head = tail = None
+                elif isinstance(source, bytes):
+                    head, tail = source[:cut], source[cut:]
+                else:
+                    head, tail = source, source + cut
+                segments[i:i + 1] = [(cut, head), (size - cut, tail)]
+                starts.insert(i + 1, offset)
+                return i + 1
+
+        end = starts[-1] + segments[-1][0] if segments else 0
+        if offset > end:
+            segments.append((offset - end, None))
+            starts.append(end)
+            self._size = offset
+        return len(segments)
+
+    def read(self, size=-1):
+        start = min(self._pos, self._size)
+        end = self._size if size < 0 else min(start + size, self._size)
+        data = []
+        starts = self._starts
+        for i in xrange(max(bisect_right(starts, start) - 1, 0), len(starts)):
+            pos = starts[i]
+            if pos >= end:
+                break
+            seg_size, source = self._segments[i]
+            offset = max(start - pos, 0)
+            length = min(end - pos, seg_size) - offset
+            if source is None:
+                data.append(b"\x00" * length)
+            elif isinstance(source, bytes):
+                data.append(source[offset:offset + length])
+            else:
+                self._fileobj.seek(source + offset)
+                data.append(read_full(self._fileobj, length))
+        data = b"".join(data)
+        self._pos += len(data)
+        return data
+
+    def write(self, data):
+        data = bytes(data)
+        if not data:
+            return
+        self._changed = True
+        start = self._split(self._pos)
+        end = self._split(self._pos + len(data))
+        self._segments[start:end] = [(len(data), data)]
+        self._starts[start:end] = [self._pos]
+        self._pos += len(data)
+        self._size = max(self._size, self._pos)
+
+    def truncate(self, size=None):
+        if size is None:
+            size = self._pos
+        self._changed = True
+        index = self._split(size)
+        del self._segments[index:]
+        del self._starts[index:]
+        self._size = size
+
+    def _insert(self, size, offset):
+        if not size:
+            return
+        self._changed = True
+        self._moved += self._size - offset
+        index = self._split(offset)
+        self._segments.insert(index, (size, None))
+        starts = self._starts
+        starts[index:] = [offset] + [s + size for s in starts[index:]]
+        self._size += size
+
+    def _delete(self, size, offset):
+        if not size:
+            return
+        self._changed = True
+        self._moved += self._size - offset - size
+        start = self._split(offset)
+        end = self._split(offset + size)
+        del self._segments[start:end]
+        starts = self._starts
+        starts[start:] = [s - size for s in starts[end:]]
+        self._size -= size
+
+    def _apply(self):
+        """Carries out all changes on the wrapped file"""
+
+        if not self._changed:
+            return
+
+        # Segments from the original file stay in order, so everything
+        # in between them replaces the original data in between.
+        plan = EditPlan(self._fileobj)
+        pos = 0
+        parts = []
+        for size, source in self._segments:
+            if source is None:
+                parts.append(b"\x00" * size)
+            elif isinstance(source, bytes):
+                parts.append(source)
+            else:
+                assert source >= pos
+                if parts or source != pos:
+                    plan.replace(pos, source - pos, b"".join(parts))
+                    parts = []
+                pos = source + size
+        plan.replace(pos, self._orig_size - pos, b"".join(parts))
+        plan.apply()
+        self._changed = False
+
+    def _rewrite(self, filename):
+        """Writes the new content to a temporary file, which then replaces
+        the file at `filename`.
+        """
+
+        if not self._changed:
+            return
+
+        # replace the target of a symlink, not the link itself
+        filename = os.path.realpath(filename)
+        dirname = os.path.dirname(filename)
+        fd, temp = tempfile.mkstemp(dir=dirname)
+        try:
+            # buffered, so writes can't end up incomplete unnoticed
+            with os.fdopen(fd, "wb") as h:
+                for size, source in self._segments:
+                    if source is None:
+                        while size:
+                            h.write(b"\x00" * min(size, 2 ** 20))
+                            size -= min(size, 2 ** 20)
+                    elif isinstance(source, bytes):
+                        h.write(source)
+                    else:
+                        _copy_range(self._fileobj, h, source, size)
+                h.flush()
+                os.fsync(h.fileno())
+            shutil.copymode(filename, temp)
+            # Windows can't replace open files
+            self._fileobj.close()
+            if hasattr(os, "replace"):
+                os.replace(temp, filename)
+            else:
+                if os.name == "nt":
+                    os.remove(filename)
+                os.rename(temp, filename)
+        except BaseException:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            raise
+        self._changed = False
+
+        # make the rename durable as well
+        try:
+            dirfd = os.open(dirname, os.O_RDONLY)
+        except (OSError, AttributeError):
+            return
+        try:
+            os.fsync(dirfd)
+        except OSError:
+            pass
+        finally:
+            os.close(dirfd)
+
+
 def dict_match(d, key, default=None):
     """Like __getitem__ but works as if the keys() are all filename patterns.
     Returns the value of any dict key that matches the passed key.
@@ -17,9 +17,11 @@ The specification is at http://www.xiph.org/vorbis/doc/v-comment.html.
 """
 
 import sys
+from bisect import bisect_left
 
 import mutagen
-from ._compat import reraise, BytesIO, text_type, xrange, PY3, PY2
+from ._compat import reraise, BytesIO, text_type, xrange, PY3, PY2, \
+    itervalues
 from mutagen._util import DictMixin, cdata, MutagenError
 
 
@@ -57,6 +59,35 @@ class VorbisEncodingError(error):
     pass
 
 
+# all bytes allowed in keys, see is_valid_key()
+_KEY_BYTES = bytes(bytearray(c for c in xrange(0x20, 0x7e) if c != 0x3d))
+
+
+class _ReadBuffer(object):
+    """Reads from a file-like object on demand and keeps all data read"""
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        # don't fail on short reads with FLAC's StrictFileObject
+        self._read = getattr(fileobj, "tryread", fileobj.read)
+        self.data = b""
+
+    def ensure(self, size):
+        """Returns if `size` bytes could be read"""
+
+        while len(self.data) < size:
+            # read at least as much as we have, but limit the size in case
+            # the requested size is wrong
+            read_size = max(size - len(self.data), len(self.data), 4096)
+            chunk = self._read(min(read_size, 2 ** 24))
+            if not chunk:
+                # let wrappers failing on short reads raise their error
+                self._fileobj.read(1)
+                return False
+            self.data += chunk
+        return True
+
+
 class VComment(mutagen.Tags, list):
     """A Vorbis comment parser, accessor, and renderer.
 
@@ -100,16 +131,45 @@ class VComment(mutagen.Tags, list):
         but are not used in FLAC Vorbis comment blocks.
         """
 
+        start = fileobj.tell()
+        buf = _ReadBuffer(fileobj)
+        uint_le_from = cdata.uint_le_from
+        offset = 0
+
         try:
-            vendor_length = cdata.uint_le(fileobj.read(4))
-            self.vendor = fileobj.read(vendor_length).decode('utf-8', errors)
-            count = cdata.uint_le(fileobj.read(4))
+            buf.ensure(4)
+            vendor_length, offset = uint_le_from(buf.data, 0)
+            if not buf.ensure(offset + vendor_length + 4):
+                raise error("file is not a valid Vorbis comment")
+            data = buf.data
+            end = offset + vendor_length
+            self.vendor = data[offset:end].decode('utf-8', errors)
+            count, offset = uint_le_from(data, end)
             for i in xrange(count):
-                length = cdata.uint_le(fileobj.read(4))
-                try:
-                    string = fileobj.read(length).decode('utf-8', errors)
-                except (OverflowError, MemoryError):
+                if not buf.ensure(offset + 4):
+                    raise error("file is not a valid Vorbis comment")
+                data = buf.data
+                length, offset = uint_le_from(data, offset)
+                end = offset + length
+                if not buf.ensure(end):
                     raise error("cannot read %d bytes, too large" % length)
+                data = buf.data
+
+                # fast path for valid keys, which are always ASCII, so the
+                # value can be decoded on its own
+                sep = data.find(b"=", offset, end)
+                if sep > offset and not data[offset:sep].translate(
+                        None, _KEY_BYTES):
+                    tag = data[offset:sep]
+                    if PY3:
+                        tag = tag.decode("ascii")
+                    self.append((tag, data[sep + 1:end].decode(
+                        'utf-8', errors)))
+                    offset = end
+                    continue
+
+                string = data[offset:end].decode('utf-8', errors)
+                offset = end
                 try:
                     tag, value = string.split('=', 1)
                 except ValueError as err:
@@ -130,10 +190,16 @@ class VComment(mutagen.Tags, list):
                     if is_valid_key(tag):
                         self.append((tag, value))
 
-            if framing and not bytearray(fileobj.read(1))[0] & 0x01:
-                raise VorbisUnsetFrameError("framing bit was unset")
+            if framing:
+                if not buf.ensure(offset + 1) or \
+                        not bytearray(buf.data[offset:offset + 1])[0] & 0x01:
+                    raise VorbisUnsetFrameError("framing bit was unset")
+                offset += 1
         except (cdata.error, TypeError):
             raise error("file is not a valid Vorbis comment")
+        finally:
+            # we might have read too much
+            fileobj.seek(start + offset, 0)
 
     def validate(self):
         """Validate keys and values.
@@ -175,8 +241,7 @@ class VComment(mutagen.Tags, list):
     def clear(self):
         """Clear all keys from the comment."""
 
-        for i in list(self):
-            self.remove(i)
+        del self[:]
 
     def write(self, framing=True):
         """Return a string representation of the data.
@@ -235,6 +300,77 @@ class VCommentDict(VComment, DictMixin):
     normalized to lowercase ASCII.
     """
 
+    # lowercase key -> list of positions in the list, None if it needs
+    # to be rebuilt because the list was changed.
+    _index = None
+
+    def _get_index(self):
+        if self._index is None:
+            index = {}
+            for i, (key, value) in enumerate(self):
+                index.setdefault(key.lower(), []).append(i)
+            self._index = index
+        return self._index
+
+    def _invalidate(self):
+        self._index = None
+
+    def __getstate__(self):
+        # copy.deepcopy() restores the state before appending the items,
+        # so don't include the index
+        state = self.__dict__.copy()
+        state.pop("_index", None)
+        return state
+
+    def append(self, item):
+        if self._index is not None:
+            try:
+                self._index.setdefault(item[0].lower(), []).append(len(self))
+            except (TypeError, IndexError, AttributeError):
+                self._index = None
+        VComment.append(self, item)
+
+    def extend(self, items):
+        self._invalidate()
+        VComment.extend(self, items)
+
+    def insert(self, index, item):
+        self._invalidate()
+        VComment.insert(self, index, item)
+
+    def remove(self, item):
+        self._invalidate()
+        VComment.remove(self, item)
+
+    def pop(self, *args):
+        self._invalidate()
+        return VComment.pop(self, *args)
+
+    def sort(self, *args, **kwargs):
+        self._invalidate()
+        VComment.sort(self, *args, **kwargs)
+
+    def reverse(self):
+        self._invalidate()
+        VComment.reverse(self)
+
+    def __iadd__(self, other):
+        self._invalidate()
+        return VComment.__iadd__(self, other)
+
+    def __imul__(self, other):
+        self._invalidate()
+        return VComment.__imul__(self, other)
+
+    if PY2:
+        def __setslice__(self, i, j, sequence):
+            self._invalidate()
+            VComment.__setslice__(self, i, j, sequence)
+
+        def __delslice__(self, i, j):
+            self._invalidate()
+            VComment.__delslice__(self, i, j)
+
     def __getitem__(self, key):
         """A list of values for the key.
 
@@ -251,29 +387,39 @@ class VCommentDict(VComment, DictMixin):
 
         key = key.lower()
 
-        values = [value for (k, value) in self if k.lower() == key]
-        if not values:
+        positions = self._get_index().get(key)
+        if not positions:
             raise KeyError(key)
         else:
-            return values
+            return [VComment.__getitem__(self, i)[1] for i in positions]
 
     def __delitem__(self, key):
         """Delete all values associated with the key."""
 
         # PY3 only
         if isinstance(key, slice):
+            self._invalidate()
             return VComment.__delitem__(self, key)
 
         if not is_valid_key(key):
             raise ValueError
 
         key = key.lower()
-        to_delete = [x for x in self if x[0].lower() == key]
-        if not to_delete:
+        index = self._get_index()
+        positions = index.get(key)
+        if not positions:
             raise KeyError(key)
-        else:
-            for item in to_delete:
-                self.remove(item)
+
+        # deleting from the back keeps the other positions valid
+        for i in reversed(positions):
+            VComment.__delitem__(self, i)
+
+        # move the following positions by the number of deleted values
+        # before them
+        del index[key]
+        for other in itervalues(index):
+            if other[-1] > positions[0]:
+                other[:] = [p - bisect_left(positions, p) for p in other]
 
     def __contains__(self, key):
         """Return true if the key has any values."""
@@ -281,12 +427,7 @@ class VCommentDict(VComment, DictMixin):
         if not is_valid_key(key):
             raise ValueError
 
-        key = key.lower()
-        for k, value in self:
-            if k.lower() == key:
-                return True
-        else:
-            return False
+        return key.lower() in self._get_index()
 
     def __setitem__(self, key, values):
         """Set a key's value or values.
@@ -298,6 +439,7 @@ class VCommentDict(VComment, DictMixin):
 
         # PY3 only
         if isinstance(key, slice):
+            self._invalidate()
             return VComment.__setitem__(self, key, values)
 
         if not is_valid_key(key):
@@ -319,7 +461,7 @@ class VCommentDict(VComment, DictMixin):
     def keys(self):
         """Return all keys in the comment."""
 
-        return list(set([k.lower() for k, v in self]))
+        return list(self._get_index())
 
     def as_dict(self):
         """Return a copy of the comment data in a real dict."""
@@ -399,7 +399,7 @@ class AAC(FileType):
 
     _mimes = ["audio/x-aac"]
 
-    @loadfile()
+    @loadfile(cached=True)
     def load(self, filething):
         self.info = AACInfo(filething.fileobj)
 
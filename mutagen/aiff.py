@@ -18,7 +18,7 @@ from mutagen import StreamInfo, FileType
 
 from mutagen.id3 import ID3
 from mutagen.id3._util import ID3NoHeaderError, error as ID3Error
-from mutagen._util import resize_bytes, delete_bytes, MutagenError, loadfile, \
+from mutagen._util import EditPlan, MutagenError, loadfile, \
     convert_error
 
 __all__ = ["AIFF", "Open", "delete"]
@@ -105,29 +105,39 @@ class IFFChunk(object):
     def delete(self):
         """Removes the chunk from the file"""
 
-        delete_bytes(self.__fileobj, self.size, self.offset)
+        plan = EditPlan(self.__fileobj)
+        plan.delete(self.offset, self.size)
         if self.parent_chunk is not None:
             self.parent_chunk._update_size(
-                self.parent_chunk.data_size - self.size)
+                self.parent_chunk.data_size - self.size, plan)
+        plan.apply()
 
-    def _update_size(self, data_size):
-        """Update the size of the chunk"""
+    def _update_size(self, data_size, plan=None):
+        """Update the size of the chunk. If an EditPlan is passed the
+        change gets added to it instead of being written right away.
+        """
 
-        self.__fileobj.seek(self.offset + 4)
-        self.__fileobj.write(pack('>I', data_size))
+        if plan is None:
+            plan = EditPlan(self.__fileobj)
+            self._update_size(data_size, plan)
+            plan.apply()
+            return
+
+        plan.write(self.offset + 4, pack('>I', data_size))
         if self.parent_chunk is not None:
             size_diff = self.data_size - data_size
             self.parent_chunk._update_size(
-                self.parent_chunk.data_size - size_diff)
+                self.parent_chunk.data_size - size_diff, plan)
         self.data_size = data_size
         self.size = data_size + self.HEADER_SIZE
 
     def resize(self, new_data_size):
         """Resize the file and update the chunk sizes"""
 
-        resize_bytes(
-            self.__fileobj, self.data_size, new_data_size, self.data_offset)
-        self._update_size(new_data_size)
+        plan = EditPlan(self.__fileobj)
+        plan.resize(self.data_offset, self.data_size, new_data_size)
+        self._update_size(new_data_size, plan)
+        plan.apply()
 
 
 class IFFFile(object):
@@ -351,7 +361,7 @@ class AIFF(FileType):
             raise error("an ID3 tag already exists")
 
     @convert_error(IOError, error)
-    @loadfile()
+    @loadfile(cached=True)
     def load(self, filething, **kwargs):
         """Load stream and tag information from a file."""
 
@@ -283,7 +283,7 @@ class APEv2(_CIDictProxy, Metadata):
         return u"\n".join(u"%s=%s" % (k, v.pprint()) for k, v in items)
 
     @convert_error(IOError, error)
-    @loadfile()
+    @loadfile(cached=True)
     def load(self, filething):
         """Load tags from a filename.
 
@@ -733,7 +733,7 @@ class APEv2File(FileType):
         def pprint():
             return u"Unknown format with APEv2 tag."
 
-    @loadfile()
+    @loadfile(cached=True)
     def load(self, filething):
         fileobj = filething.fileobj
 
@@ -22,13 +22,14 @@ http://flac.sourceforge.net/format.html
 
 __all__ = ["FLAC", "Open", "delete"]
 
+import os
 import struct
 from ._vorbis import VCommentDict
 import mutagen
 
 from ._compat import cBytesIO, endswith, chr_, xrange
 from mutagen._util import resize_bytes, MutagenError, get_size, loadfile, \
-    convert_error
+    convert_error, _EditFile, _cache_fileobj
 from mutagen._tags import PaddingInfo
 from mutagen.id3._util import BitPaddedInt
 from functools import reduce
@@ -74,6 +75,18 @@ class StrictFileObject(object):
         return self._fileobj.read(*args)
 
 
+def _get_file_stamp(filename):
+    """Returns (size, mtime) of the file, to detect changes by others since
+    it was last read or written, or None if it can't be accessed.
+    """
+
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_size, getattr(st, "st_mtime_ns", st.st_mtime))
+
+
 class MetadataBlock(object):
     """A generic block of FLAC metadata.
 
@@ -121,10 +134,19 @@ class MetadataBlock(object):
         Raises error.
         """
 
-        data = bytearray()
-        code = (block.code | 128) if is_last else block.code
         datum = block.write()
-        size = len(datum)
+        data = cls._writeblockheader(block, len(datum), is_last)
+        data += datum
+        return data
+
+    @classmethod
+    def _writeblockheader(cls, block, size, is_last=False):
+        """Returns the block header for content of the given size.
+
+        Raises error.
+        """
+
+        code = (block.code | 128) if is_last else block.code
         if size > cls._MAX_SIZE:
             if block._distrust_size and block._invalid_overflow_size != -1:
                 # The original size of this block was (1) wrong and (2)
@@ -137,22 +159,52 @@ class MetadataBlock(object):
                 raise error("block is too long to write")
         assert not size > cls._MAX_SIZE
         length = struct.pack(">I", size)[-3:]
+        data = bytearray()
         data.append(code)
         data += length
-        data += datum
         return data
 
     @classmethod
     def _writeblocks(cls, blocks, available, cont_size, padding_func):
         """Render metadata block as a byte string."""
 
-        # write everything except padding
         data = bytearray()
+        for part in cls._renderblocks(
+                blocks, available, cont_size, padding_func, None, None):
+            data += part
+        return data
+
+    @classmethod
+    def _renderblocks(cls, blocks, available, cont_size, padding_func,
+                      filename, stamp):
+        """Like _writeblocks(), but returns a list with one rendered block
+        per entry.
+
+        The data of pictures which is unchanged since it was loaded from
+        `filename` (see Picture._get_origin()) is left out and the picture
+        itself takes its place in the list instead.
+        """
+
+        # write everything except padding
+        parts = []
+        blockssize = 0
         for block in blocks:
             if isinstance(block, Padding):
                 continue
-            data += cls._writeblock(block)
-        blockssize = len(data)
+            origin = None
+            if isinstance(block, Picture):
+                origin = block._get_origin(filename, stamp)
+            if origin is not None:
+                head = block._write_header()
+                data = cls._writeblockheader(block, len(head) + origin[1])
+                data += head
+                parts.append(data)
+                parts.append(block)
+                blockssize += len(data) + origin[1]
+            else:
+                data = cls._writeblock(block)
+                parts.append(data)
+                blockssize += len(data)
 
         # take the padding overhead into account. we always add one
         # to make things simple.
@@ -163,9 +215,9 @@ class MetadataBlock(object):
         info = PaddingInfo(available - blockssize, cont_size)
         padding_block.length = min(info._get_padding(padding_func),
                                    cls._MAX_SIZE)
-        data += cls._writeblock(padding_block, is_last=True)
+        parts.append(cls._writeblock(padding_block, is_last=True))
 
-        return data
+        return parts
 
 
 class StreamInfo(MetadataBlock, mutagen.StreamInfo):
@@ -335,6 +387,134 @@ class SeekTable(MetadataBlock):
         return "<%s seekpoints=%r>" % (type(self).__name__, self.seekpoints)
 
 
+def _make_crc8_table():
+    table = []
+    for i in xrange(256):
+        crc = i
+        for j in xrange(8):
+            crc = ((crc << 1) ^ 0x07 if crc & 0x80 else crc << 1) & 0xFF
+        table.append(crc)
+    return table
+
+
+_CRC8_TABLE = _make_crc8_table()
+
+_MAX_FRAME_HEADER_SIZE = 16
+"""sync (2) + codes (2) + coded number (7) + block size (2) +
+sample rate (2) + CRC-8 (1)"""
+
+
+def _parse_frame_header(data, offset):
+    """Parses a FLAC frame header starting at `offset` in `data`.
+
+    Returns a (number, block size, header size) tuple or None if there
+    is no valid header. The number is the frame number for streams with
+    a fixed block size and the sample number otherwise.
+    """
+
+    header = bytearray(data[offset:offset + _MAX_FRAME_HEADER_SIZE])
+    if len(header) < 5 or header[0] != 0xFF or header[1] & 0xFE != 0xF8:
+        return
+
+    blocksize_code = header[2] >> 4
+    rate_code = header[2] & 0xF
+    if blocksize_code == 0 or rate_code == 0xF:
+        return
+    if header[3] >> 4 >= 11 or (header[3] >> 1) & 7 == 3 or header[3] & 1:
+        return
+
+    # UTF-8 like coded frame/sample number
+    first = header[4]
+    for extra, mask in enumerate([0x80, 0xE0, 0xF0, 0xF8, 0xFC, 0xFE,
+                                  0xFF]):
+        if first & mask == (mask << 1) & 0xFF:
+            break
+    else:
+        return
+    number = first & (0x7F >> (extra + 1) if extra else 0x7F)
+    pos = 5
+    for byte in header[pos:pos + extra]:
+        if byte & 0xC0 != 0x80:
+            return
+        number = (number << 6) | (byte & 0x3F)
+    pos += extra
+
+    if blocksize_code == 1:
+        blocksize = 192
+    elif blocksize_code <= 5:
+        blocksize = 576 << (blocksize_code - 2)
+    elif blocksize_code == 6:
+        blocksize = to_int_be(header[pos:pos + 1]) + 1
+        pos += 1
+    elif blocksize_code == 7:
+        blocksize = to_int_be(header[pos:pos + 2]) + 1
+        pos += 2
+    else:
+        blocksize = 256 << (blocksize_code - 8)
+
+    if rate_code == 12:
+        pos += 1
+    elif rate_code in (13, 14):
+        pos += 2
+
+    if pos >= len(header):
+        return
+    crc = 0
+    for byte in header[:pos]:
+        crc = _CRC8_TABLE[crc ^ byte]
+    if crc != header[pos]:
+        return
+
+    return number, blocksize, pos + 1
+
+
+def _iter_frames(fileobj, info, chunk_size=2 ** 20):
+    """Yields (offset, first sample, number of samples) for all frames
+    starting at the current position of `fileobj`, which should be the
+    start of the first frame. The offset is relative to the first frame.
+
+    Only headers continuing where the previous frame ended are
+    accepted, to skip false syncs in the frame data.
+    """
+
+    data = fileobj.read(chunk_size)
+    sync = data[:2]
+    if sync not in (b"\xff\xf8", b"\xff\xf9"):
+        return
+    # fixed block size streams only store the frame number
+    fixed = info.max_blocksize if sync == b"\xff\xf8" else 0
+
+    base = 0
+    pos = 0
+    expected = 0
+    eof = False
+    while not info.total_samples or expected < info.total_samples:
+        index = data.find(sync, pos)
+        if not eof and (
+                index == -1 or len(data) - index < _MAX_FRAME_HEADER_SIZE):
+            start = index if index != -1 else max(pos, len(data) - 1)
+            chunk = fileobj.read(chunk_size)
+            eof = not chunk
+            data = data[start:] + chunk
+            base += start
+            pos = 0
+            continue
+        if index == -1:
+            break
+
+        header = _parse_frame_header(data, index)
+        if header is not None:
+            number, blocksize, size = header
+            if fixed:
+                number *= fixed
+            if number == expected:
+                yield base + index, number, blocksize
+                expected += blocksize
+                pos = index + size
+                continue
+        pos = index + 1
+
+
 class VCFLACDict(VCommentDict):
     """VCFLACDict()
 
@@ -553,6 +733,10 @@ class Picture(MetadataBlock):
             0 for non-indexed
         data (`bytes`): picture data
 
+    Pictures loaded with ``lazy=True`` from a FLAC file given by file name
+    only read their data from the file the first time `data` is accessed.
+    If the file was changed or removed in the meantime this raises `error`.
+
     To create a picture from file (in order to add to a FLAC file),
     instantiate this object without passing anything to the constructor and
     then set the properties manually::
@@ -572,6 +756,16 @@ class Picture(MetadataBlock):
     code = 6
     _distrust_size = True
 
+    _data = b''
+
+    _source = None
+    """(filename, offset, length, file stamp) of the picture data if not
+    loaded yet, see _get_file_stamp()"""
+
+    _origin = None
+    """(filename, offset, length, file stamp, data) of the picture data
+    once loaded from a file, to detect unchanged data on save"""
+
     def __init__(self, data=None):
         self.type = 0
         self.mime = u''
@@ -598,16 +792,96 @@ class Picture(MetadataBlock):
 
     __hash__ = MetadataBlock.__hash__
 
-    def load(self, data):
+    @property
+    def data(self):
+        if self._source is not None:
+            self._data = self._read_source()
+            self._origin = self._source + (self._data,)
+            self._source = None
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._source = None
+
+    @property
+    def _data_length(self):
+        if self._source is not None:
+            return self._source[2]
+        return len(self._data)
+
+    @convert_error(IOError, error)
+    def _read_source(self):
+        filename, offset, length, stamp = self._source
+        if _get_file_stamp(filename) != stamp:
+            raise error("%r changed since the picture was loaded" % filename)
+        with open(filename, "rb") as h:
+            h.seek(offset)
+            data = h.read(length)
+        if len(data) != length:
+            raise error("file said %d bytes, read %d bytes" % (
+                        length, len(data)))
+        return data
+
+    def _load_header(self, data):
+        """Reads everything up to the picture data and returns its length"""
+
         self.type, length = struct.unpack('>2I', data.read(8))
         self.mime = data.read(length).decode('UTF-8', 'replace')
         length, = struct.unpack('>I', data.read(4))
         self.desc = data.read(length).decode('UTF-8', 'replace')
         (self.width, self.height, self.depth,
          self.colors, length) = struct.unpack('>5I', data.read(20))
-        self.data = data.read(length)
+        return length
+
+    def load(self, data):
+        self.data = data.read(self._load_header(data))
+
+    def _load_file(self, data, filename, stamp):
+        """Like load(), but remembers where the data was found in
+        `filename`, so saving to the unchanged file can skip it.
+        """
+
+        self.load(data)
+        length = len(self._data)
+        self._origin = (filename, data.tell() - length, length, stamp,
+                        self._data)
+
+    def _get_origin(self, filename, stamp):
+        """Returns (offset, length) of the picture data in `filename` if
+        the data is unchanged since it was loaded from there and the file
+        still has the same `stamp`, else None.
+        """
+
+        if self._source is not None:
+            origin = self._source
+        elif self._origin is not None and self._origin[4] is self._data:
+            origin = self._origin
+        else:
+            return None
+        if filename is None or stamp is None or \
+                origin[0] != filename or origin[3] != stamp:
+            return None
+        return origin[1:3]
+
+    def _load_lazy(self, data, filename, stamp=None):
+        """Like load(), but skips the picture data and only remembers
+        where to find it in `filename`, as long as it has the same `stamp`.
+        """
+
+        length = self._load_header(data)
+        offset = data.tell()
+        size = get_size(data)
+        if offset + length > size:
+            raise error("file said %d bytes, read %d bytes" % (
+                        length, size - offset))
+        data.seek(length, 1)
+        self._source = (filename, offset, length, stamp)
+
+    def _write_header(self):
+        """Returns the block content except the picture data"""
 
-    def write(self):
         f = cBytesIO()
         mime = self.mime.encode('UTF-8')
         f.write(struct.pack('>2I', self.type, len(mime)))
@@ -616,13 +890,15 @@ class Picture(MetadataBlock):
         f.write(struct.pack('>I', len(desc)))
         f.write(desc)
         f.write(struct.pack('>5I', self.width, self.height, self.depth,
-                            self.colors, len(self.data)))
-        f.write(self.data)
+                            self.colors, self._data_length))
         return f.getvalue()
 
+    def write(self):
+        return self._write_header() + self.data
+
     def __repr__(self):
         return "<%s '%s' (%d bytes)>" % (type(self).__name__, self.mime,
-                                         len(self.data))
+                                         self._data_length)
 
 
 class Padding(MetadataBlock):
@@ -668,12 +944,15 @@ class Padding(MetadataBlock):
 
 
 class FLAC(mutagen.FileType):
-    """FLAC(filething)
+    """FLAC(filething, lazy=False)
 
     A FLAC audio file.
 
     Args:
         filething (filething)
+        lazy (bool): Only read the data of pictures once it gets accessed,
+            if a file name is given. The file must not be changed by others
+            or moved in the meantime.
 
     Attributes:
         cuesheet (`CueSheet`): if any or `None`
@@ -692,14 +971,24 @@ class FLAC(mutagen.FileType):
                        CueSheet, Picture]
     """Known metadata block types, indexed by ID."""
 
+    PREFETCH_SIZE = 2 ** 16
+    """Metadata is read in cached blocks of this size. Bigger blocks result
+    in fewer reads on files with big metadata blocks."""
+
+    _audio_offset = None
+    """(filename, file stamp, header, audio offset) for the loaded file,
+    to skip searching for the audio when saving to it, see
+    _get_file_stamp()."""
+
     @staticmethod
     def score(filename, fileobj, header_data):
         return (header_data.startswith(b"fLaC") +
                 endswith(filename.lower(), ".flac") * 3)
 
-    def __read_metadata_block(self, fileobj):
-        byte = ord(fileobj.read(1))
-        size = to_int_be(fileobj.read(3))
+    def __read_metadata_block(self, fileobj, filename, stamp, lazy):
+        header = fileobj.read(4)
+        byte = ord(header[:1])
+        size = to_int_be(header[1:])
         code = byte & 0x7F
         last_block = bool(byte & 0x80)
 
@@ -719,7 +1008,15 @@ class FLAC(mutagen.FileType):
             # ..same for the Picture block:
             # https://github.com/quodlibet/mutagen/issues/106
             start = fileobj.tell()
-            block = block_type(fileobj)
+            if block_type is Picture and filename is not None:
+                block = Picture()
+                if lazy:
+                    # the picture data gets read once accessed
+                    block._load_lazy(fileobj, filename, stamp)
+                else:
+                    block._load_file(fileobj, filename, stamp)
+            else:
+                block = block_type(fileobj)
             real_size = fileobj.tell() - start
             if real_size > MetadataBlock._MAX_SIZE:
                 block._invalid_overflow_size = size
@@ -775,19 +1072,35 @@ class FLAC(mutagen.FileType):
 
     @convert_error(IOError, error)
     @loadfile()
-    def load(self, filething):
-        """Load file information from a filename."""
+    def load(self, filething, lazy=False):
+        """load(filething, lazy=False)
+
+        Load file information from a filename.
+
+        Args:
+            filething (filething)
+            lazy (bool): Only read the data of pictures once it gets
+                accessed, if a file name is given. The file must not be
+                changed by others or moved in the meantime.
+        """
 
         fileobj = filething.fileobj
+        stamp = None
+        if filething.filename is not None:
+            stamp = _get_file_stamp(filething.filename)
 
         self.metadata_blocks = []
         self.tags = None
         self.cuesheet = None
         self.seektable = None
 
-        fileobj = StrictFileObject(fileobj)
-        self.__check_header(fileobj, filething.name)
-        while self.__read_metadata_block(fileobj):
+        self._audio_offset = None
+
+        fileobj = StrictFileObject(
+            _cache_fileobj(fileobj, self.PREFETCH_SIZE))
+        header = self.__check_header(fileobj, filething.name)
+        while self.__read_metadata_block(
+                fileobj, filething.filename, stamp, lazy):
             pass
 
         try:
@@ -797,8 +1110,12 @@ class FLAC(mutagen.FileType):
 
         start = fileobj.tell()
         fileobj.seek(0, 2)
+        size = fileobj.tell()
         self.info.bitrate = int(
-            float(fileobj.tell() - start) * 8 / self.info.length)
+            float(size - start) * 8 / self.info.length)
+
+        if stamp is not None:
+            self._audio_offset = (filething.filename, stamp, header, start)
 
     @property
     def info(self):
@@ -827,6 +1144,70 @@ class FLAC(mutagen.FileType):
 
         return [b for b in self.metadata_blocks if b.code == Picture.code]
 
+    @staticmethod
+    @convert_error(IOError, error)
+    @loadfile(method=False)
+    def __find_seekpoints(filething, flac, interval_seconds):
+        fileobj = filething.fileobj
+        reader = StrictFileObject(
+            _cache_fileobj(fileobj, flac.PREFETCH_SIZE))
+        header = flac.__check_header(reader, filething.name)
+        audio_offset = flac.__get_audio_offset(
+            StrictFileObject(fileobj), header, filething.filename)
+        if audio_offset is None:
+            audio_offset = flac.__find_audio_offset(reader)
+
+        interval = max(int(interval_seconds * flac.info.sample_rate), 1)
+        target = 0
+        seekpoints = []
+        fileobj.seek(audio_offset)
+        for offset, sample, count in _iter_frames(fileobj, flac.info):
+            if target < sample + count:
+                seekpoints.append(SeekPoint(sample, offset, count))
+                target += ((sample + count - target - 1) // interval + 1) * \
+                    interval
+        return seekpoints
+
+    def build_seektable(self, filething=None, interval_seconds=10):
+        """Scans the audio frames and replaces the seek table with one
+        pointing to the frames containing the samples every
+        `interval_seconds` seconds.
+
+        If there is no seek table yet, the new one is placed in front of
+        the padding, so it can use up the padding on save instead of
+        moving all the following blocks. Call `save()` to write it to
+        the file.
+
+        If no filename is given, the one most recently loaded is used.
+        The file is only read.
+
+        Args:
+            filething (filething)
+            interval_seconds (float): time between two seek points
+        Returns:
+            SeekTable: the new seek table
+        Raises:
+            mutagen.MutagenError
+        """
+
+        if interval_seconds <= 0:
+            raise ValueError("interval_seconds has to be positive")
+
+        if filething is None:
+            filething = self.filename
+        seekpoints = self.__find_seekpoints(filething, self, interval_seconds)
+
+        if self.seektable is None:
+            self.seektable = SeekTable(None)
+            index = len(self.metadata_blocks)
+            for i, block in enumerate(self.metadata_blocks):
+                if isinstance(block, Padding):
+                    index = i
+                    break
+            self.metadata_blocks.insert(index, self.seektable)
+        self.seektable.seekpoints = seekpoints
+        return self.seektable
+
     @convert_error(IOError, error)
     @loadfile(writable=True)
     def save(self, filething, deleteid3=False, padding=None):
@@ -841,8 +1222,13 @@ class FLAC(mutagen.FileType):
         """
 
         f = StrictFileObject(filething.fileobj)
-        header = self.__check_header(f, filething.name)
-        audio_offset = self.__find_audio_offset(f)
+        reader = StrictFileObject(
+            _cache_fileobj(filething.fileobj, self.PREFETCH_SIZE))
+        header = self.__check_header(reader, filething.name)
+        audio_offset = self.__get_audio_offset(
+            f, header, filething.filename)
+        if audio_offset is None:
+            audio_offset = self.__find_audio_offset(reader)
         # "fLaC" and maybe ID3
         available = audio_offset - header
 
@@ -853,14 +1239,63 @@ class FLAC(mutagen.FileType):
 
         content_size = get_size(f) - audio_offset
         assert content_size >= 0
-        data = MetadataBlock._writeblocks(
-            self.metadata_blocks, available, content_size, padding)
-        data_size = len(data)
+        filename = filething.filename
+
+        # Lazy pictures are copied from the file, make sure it's still the
+        # one they were loaded from. If the changes don't get written to
+        # the file directly, the stamp afterwards isn't known, so load them.
+        pictures = [b for b in self.metadata_blocks if isinstance(b, Picture)]
+        stamp = None
+        if filename is not None and pictures:
+            stamp = _get_file_stamp(filename)
+        lazy_pictures = [p for p in pictures if p._source is not None and
+                         p._source[0] == filename]
+        for picture in lazy_pictures:
+            if picture._source[3] != stamp:
+                raise error(
+                    "%r changed since the pictures were loaded" % filename)
+        if isinstance(filething.fileobj, _EditFile):
+            for picture in lazy_pictures:
+                picture.data = picture.data
+        parts = MetadataBlock._renderblocks(self.metadata_blocks, available,
+                                            content_size, padding, filename,
+                                            stamp)
+
+        # Only write what differs from the current file content. Data
+        # in front of the old end of the metadata stays in place when
+        # resizing, so we can compare against it beforehand. Picture data
+        # unchanged since loaded from the file is neither rendered nor
+        # compared, only written if the block moved. Data not loaded yet is
+        # copied over from its old location for that.
+        old_end = header + available
+        writes = []
+        placed = []
+        offset = header - 4
+        for part in [b"fLaC"] + parts:
+            if isinstance(part, Picture):
+                old_offset, length = part._get_origin(filename, stamp)
+                if offset != old_offset:
+                    if part._source is not None:
+                        f.seek(old_offset)
+                        writes.append((offset, f.read(length)))
+                    else:
+                        writes.append((offset, part._data))
+                placed.append((part, offset))
+            else:
+                length = len(part)
+                if offset + length > old_end:
+                    writes.append((offset, part))
+                else:
+                    reader.seek(offset)
+                    if reader.read(length) != part:
+                        writes.append((offset, part))
+            offset += length
+        data_size = offset - header
 
         resize_bytes(filething.fileobj, available, data_size, header)
-        f.seek(header - 4)
-        f.write(b"fLaC")
-        f.write(data)
+        for offset, data in writes:
+            f.seek(offset)
+            f.write(data)
 
         # Delete ID3v1
         if deleteid3:
@@ -873,19 +1308,60 @@ class FLAC(mutagen.FileType):
                     f.seek(-128, 2)
                     f.truncate()
 
+        self._audio_offset = None
+        if filename is not None and \
+                not isinstance(filething.fileobj, _EditFile):
+            filething.fileobj.flush()
+            stamp = _get_file_stamp(filename)
+            if stamp is not None:
+                self._audio_offset = (
+                    filename, stamp, header, header + data_size)
+
+            for picture, offset in placed:
+                if picture._source is not None:
+                    picture._source = (
+                        filename, offset, picture._source[2], stamp)
+                else:
+                    picture._origin = (filename, offset, len(picture._data),
+                                       stamp, picture._data)
+
+    def __get_audio_offset(self, fileobj, header, filename):
+        """Returns the audio offset found on the last load or save, if the
+        file wasn't changed since, or None.
+        """
+
+        if self._audio_offset is None or filename is None:
+            return
+        old_filename, stamp, old_header, audio_offset = self._audio_offset
+        if (old_filename, old_header) != (filename, header) or \
+                _get_file_stamp(filename) != stamp:
+            self._audio_offset = None
+            return
+
+        # make sure a frame starts there
+        fileobj.seek(audio_offset)
+        sync = bytearray(fileobj.tryread(2))
+        if len(sync) == 2 and sync[0] == 0xFF and sync[1] & 0xFE == 0xF8:
+            return audio_offset
+
     def __find_audio_offset(self, fileobj):
         byte = 0x00
         while not (byte & 0x80):
-            byte = ord(fileobj.read(1))
-            size = to_int_be(fileobj.read(3))
+            header = fileobj.read(4)
+            byte = ord(header[:1])
+            size = to_int_be(header[1:])
             try:
                 block_type = self.METADATA_BLOCKS[byte & 0x7F]
             except IndexError:
                 block_type = None
 
-            if block_type and block_type._distrust_size:
+            if block_type is Picture:
                 # See comments in read_metadata_block; the size can't
-                # be trusted for Vorbis comment blocks and Picture block
+                # be trusted for the Picture block, but we only need
+                # to skip the picture data
+                Picture()._load_lazy(fileobj, None)
+            elif block_type and block_type._distrust_size:
+                # same for Vorbis comment blocks
                 block_type(fileobj)
             else:
                 fileobj.read(size)
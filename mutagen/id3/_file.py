@@ -14,10 +14,11 @@ import mutagen
 from mutagen._util import insert_bytes, delete_bytes, enum, \
     loadfile, convert_error, read_full
 from mutagen._tags import PaddingInfo
+from mutagen._compat import PY3
 
 from ._util import error, ID3NoHeaderError, ID3UnsupportedVersionError, \
-    BitPaddedInt
-from ._tags import ID3Tags, ID3Header, ID3SaveConfig
+    BitPaddedInt, is_valid_frame_id
+from ._tags import ID3Tags, ID3Header, ID3SaveConfig, determine_bpi
 from ._id3v1 import MakeID3v1, find_id3v1
 
 
@@ -74,6 +75,7 @@ class ID3(ID3Tags, mutagen.Metadata):
     def __init__(self, *args, **kwargs):
         self._header = None
         self._version = (2, 4, 0)
+        self._partial = False
         super(ID3, self).__init__(*args, **kwargs)
 
     @property
@@ -112,8 +114,10 @@ class ID3(ID3Tags, mutagen.Metadata):
 
     @convert_error(IOError, error)
     @loadfile()
-    def load(self, filething, known_frames=None, translate=True, v2_version=4):
-        """load(filething, known_frames=None, translate=True, v2_version=4)
+    def load(self, filething, known_frames=None, translate=True, v2_version=4,
+             lazy=False, frames=None):
+        """load(filething, known_frames=None, translate=True, v2_version=4, \
+lazy=False, frames=None)
 
         Load tags from a filename.
 
@@ -126,6 +130,12 @@ class ID3(ID3Tags, mutagen.Metadata):
                 call update_to_v23() / update_to_v24() manually.
             v2_version (int): if update_to_v23 or update_to_v24 get called
                 (3 or 4)
+            lazy (bool): Only decode frames once they are accessed. Frames
+                which never get accessed are saved back unchanged.
+            frames (List[`mutagen.text`]): If not `None`, only load frames
+                with these IDs (as stored in the file, v2.2 IDs are
+                upgraded) and skip over the data of all others. The
+                resulting tag is incomplete and can't be saved.
 
         Example of loading a custom frame::
 
@@ -141,8 +151,10 @@ class ID3(ID3Tags, mutagen.Metadata):
             raise ValueError("Only 3 and 4 possible for v2_version")
 
         self.unknown_frames = []
+        self._lazy_frames = {}
         self._header = None
         self._padding = 0
+        self._partial = frames is not None
 
         self._pre_load_header(fileobj)
 
@@ -161,9 +173,31 @@ class ID3(ID3Tags, mutagen.Metadata):
             if known_frames is not None:
                 self._header._known_frames = known_frames
 
-            data = read_full(fileobj, self.size - 10)
-            remaining_data = self._read(self._header, data)
-            self._padding = len(remaining_data)
+            read = None
+            if frames is not None:
+                start = fileobj.tell()
+                read = self.__read_only(fileobj, frames)
+                if read is None:
+                    fileobj.seek(start)
+
+            if read is not None:
+                data, self._padding = read
+                self._read(self._header, data, lazy)
+            else:
+                data = read_full(fileobj, self.size - 10)
+                if self._header.version >= ID3Header._V24:
+                    # all frames in a tag, including the ones nested in
+                    # CHAP/CTOC, share the same frame size type
+                    self._header._bpi = determine_bpi(
+                        data, self._header.known_frames)
+                remaining_data = self._read(self._header, data, lazy)
+                self._padding = len(remaining_data)
+
+                if frames is not None:
+                    self.unknown_frames = []
+                    for key in list(self.keys()):
+                        if key.split(":", 1)[0] not in frames:
+                            del self[key]
 
         if translate:
             if v2_version == 3:
@@ -171,9 +205,67 @@ class ID3(ID3Tags, mutagen.Metadata):
             else:
                 self.update_to_v24()
 
+    def __read_only(self, fileobj, frame_ids):
+        """Walks the frame headers and reads only the frames with the given
+        IDs, seeking past the data of all others.
+
+        Returns the raw data of the read frames and the padding size, or
+        None in case the whole tag has to be read instead.
+        """
+
+        header = self._header
+
+        # v2.2 frame IDs differ and v2.3 unsynchronisation applies to the
+        # whole tag, so frame sizes don't match the data in the file
+        if header.version < ID3Header._V23 or \
+                (header.version < ID3Header._V24 and header.f_unsynch):
+            return
+
+        start = fileobj.tell()
+        end = start + self.size - 10
+        offset = start
+        frames = []
+
+        while end - offset >= 10:
+            frame_header = read_full(fileobj, 10)
+            name, size, flags = struct.unpack('>4sLH', frame_header)
+            if name.strip(b'\x00') == b'':
+                break
+
+            if PY3:
+                try:
+                    name = name.decode('ascii')
+                except UnicodeDecodeError:
+                    return
+
+            if header.version >= ID3Header._V24:
+                # if the sizes aren't syncsafe this could be an iTunes tag
+                # which needs determine_bpi() and the full data
+                if not BitPaddedInt.has_valid_padding(size):
+                    return
+                size = BitPaddedInt(size)
+
+            if not is_valid_frame_id(name):
+                # not where a frame should be, so the frame sizes are off
+                return
+
+            offset += 10
+            size = min(size, end - offset)
+            if name in frame_ids:
+                frames.append(frame_header + fileobj.read(size))
+            else:
+                fileobj.seek(size, 1)
+            offset += size
+
+        header._bpi = BitPaddedInt
+        return b"".join(frames), max(end - offset, 0)
+
     def _prepare_data(self, fileobj, start, available, v2_version, v23_sep,
                       pad_func):
 
+        if self._partial:
+            raise error("Tags loaded with a frame filter can't be saved")
+
         if v2_version not in (3, 4):
             raise ValueError("Only 3 or 4 allowed for v2_version")
 
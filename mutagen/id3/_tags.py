@@ -10,7 +10,7 @@ import struct
 
 from mutagen._tags import Tags
 from mutagen._util import DictProxy, convert_error, read_full
-from mutagen._compat import PY3, text_type, itervalues
+from mutagen._compat import PY3, text_type, iteritems
 
 from ._util import BitPaddedInt, unsynch, ID3JunkFrameError, \
     ID3EncryptionUnsupportedError, is_valid_frame_id, error, \
@@ -33,6 +33,9 @@ class ID3Header(object):
 
     _known_frames = None
 
+    # the frame size type of a v2.4 tag (see determine_bpi), if known
+    _bpi = None
+
     @property
     def known_frames(self):
         if self._known_frames is not None:
@@ -113,52 +116,85 @@ class ID3Header(object):
             self._extdata = read_full(fileobj, extsize)
 
 
-def determine_bpi(data, frames, EMPTY=b"\x00" * 10):
+def _bpi_step(data, o, frames, bpi):
+    """Advance one frame from offset `o` using `bpi` for the frame size.
+
+    Returns the new offset, if the frame name is known and if the frame
+    area ended in padding.
+    """
+
+    name, size, flags = struct.unpack_from('>4sLH', data, o)
+    if name == b"\x00\x00\x00\x00" and not size and not flags:
+        return o, False, True
+    o += 10 + bpi(size)
+    if PY3:
+        try:
+            name = name.decode("ascii")
+        except UnicodeDecodeError:
+            return o, False, False
+    return o, name in frames, False
+
+
+def determine_bpi(data, frames):
     """Takes id3v2.4 frame data and determines if ints or bitpaddedints
     should be used for parsing. Needed because iTunes used to write
     normal ints for frame sizes.
+
+    Both interpretations agree on all frame sizes below 0x80, so they
+    are walked as one until the first bigger frame. From there on both
+    are walked in the same pass, which stops as soon as one of them has
+    found more known frames than the other one possibly can.
     """
 
-    # count number of tags found as BitPaddedInt and how far past
-    o = 0
-    asbpi = 0
-    while o < len(data) - 10:
-        part = data[o:o + 10]
-        if part == EMPTY:
-            bpioff = -((len(data) - o) % 10)
+    end = len(data) - 10
+
+    # offset, number of known frames found and how far past the end (None
+    # while still walking), shared until the interpretations differ
+    o = known_frames = 0
+    off = None
+    while o < end:
+        if struct.unpack_from('>L', data, o + 4)[0] >= 0x80:
             break
-        name, size, flags = struct.unpack('>4sLH', part)
-        size = BitPaddedInt(size)
-        o += 10 + size
-        if PY3:
-            try:
-                name = name.decode("ascii")
-            except UnicodeDecodeError:
-                continue
-        if name in frames:
-            asbpi += 1
-    else:
-        bpioff = o - len(data)
-
-    # count number of tags found as int and how far past
-    o = 0
-    asint = 0
-    while o < len(data) - 10:
-        part = data[o:o + 10]
-        if part == EMPTY:
-            intoff = -((len(data) - o) % 10)
+        o, known, padding = _bpi_step(data, o, frames, int)
+        known_frames += known
+        if padding:
+            off = -((len(data) - o) % 10)
             break
-        name, size, flags = struct.unpack('>4sLH', part)
-        o += 10 + size
-        if PY3:
-            try:
-                name = name.decode("ascii")
-            except UnicodeDecodeError:
-                continue
-        if name in frames:
-            asint += 1
     else:
-        intoff = o - len(data)
+        off = o - len(data)
+
+    bpio = into = o
+    asbpi = asint = known_frames
+    bpioff = intoff = off
+
+    while bpioff is None or intoff is None:
+        if bpioff is None:
+            if bpio < end:
+                bpio, known, padding = _bpi_step(
+                    data, bpio, frames, BitPaddedInt)
+                asbpi += known
+                if padding:
+                    bpioff = -((len(data) - bpio) % 10)
+            else:
+                bpioff = bpio - len(data)
+
+        if intoff is None:
+            if into < end:
+                into, known, padding = _bpi_step(data, into, frames, int)
+                asint += known
+                if padding:
+                    intoff = -((len(data) - into) % 10)
+            else:
+                intoff = into - len(data)
+
+        # every step moves at least 10 bytes, which bounds the number
+        # of frames the other interpretation can still find
+        bpi_left = 0 if bpioff is not None else max(0, end - bpio + 9) // 10
+        int_left = 0 if intoff is not None else max(0, end - into + 9) // 10
+        if asbpi > asint + int_left:
+            return BitPaddedInt
+        if asint > asbpi + bpi_left:
+            return int
 
     # if more tags as int, or equal and bpi is past and int is not
     if asint > asbpi or (asint == asbpi and (bpioff >= 1 and intoff <= 1)):
@@ -166,6 +202,18 @@ def determine_bpi(data, frames, EMPTY=b"\x00" * 10):
     return BitPaddedInt
 
 
+def _apic_needs_update(pending):
+    """Takes an APIC frame kept raw by a lazy load and returns if its MIME
+    type might get changed by update_to_v23()/update_to_v24().
+    """
+
+    tag, flags, header, data = pending
+    if flags:
+        # compressed or unsynchronised, can't tell without decoding
+        return True
+    return data[1:].split(b"\x00", 1)[0] in (b"PNG", b"JPG")
+
+
 class ID3Tags(DictProxy, Tags):
 
     __module__ = "mutagen.id3"
@@ -173,36 +221,136 @@ class ID3Tags(DictProxy, Tags):
     def __init__(self, *args, **kwargs):
         self.unknown_frames = []
         self._unknown_v2_version = 4
+        # frames kept undecoded by a lazy load, see _load_lazy()
+        self._lazy_frames = {}
+        self._lazy_header = None
+        self._lazy_update = False
         super(ID3Tags, self).__init__(*args, **kwargs)
 
-    def _read(self, header, data):
+    def _read(self, header, data, lazy=False):
+        lazy_frames = {} if lazy else None
         frames, unknown_frames, data = read_frames(
-            header, data, header.known_frames)
+            header, data, header.known_frames, lazy_frames)
+        self._lazy_frames = lazy_frames or {}
+        self._lazy_header = header
+        self._lazy_update = False
         for frame in frames:
             self._add(frame, False)
         self.unknown_frames = unknown_frames
         self._unknown_v2_version = header.version[1]
         return data
 
+    def _load_lazy(self, key=None):
+        """Decode the frames kept raw by a lazy load which could be
+        stored under `key`, or all of them if `key` is None.
+        """
+
+        if not self._lazy_frames:
+            return
+
+        if key is None:
+            frame_ids = list(self._lazy_frames)
+        else:
+            frame_ids = [key.split(":", 1)[0]]
+
+        for frame_id in frame_ids:
+            pending = self._lazy_frames.pop(frame_id, None)
+            if pending is None:
+                continue
+
+            frames = []
+            for tag, flags, header, framedata in pending:
+                _read_frame(self._lazy_header, tag, flags, header, framedata,
+                            frames, self.unknown_frames)
+            for frame in frames:
+                self._add(frame, False)
+
+            if frame_id == "APIC" and self._lazy_update:
+                self.__update_apic()
+
+    def __getitem__(self, key):
+        self._load_lazy(key)
+        return super(ID3Tags, self).__getitem__(key)
+
+    def __delitem__(self, key):
+        self._load_lazy(key)
+        super(ID3Tags, self).__delitem__(key)
+
+    def keys(self):
+        self._load_lazy()
+        return super(ID3Tags, self).keys()
+
+    def _lazy_write(self, config):
+        """Returns a list of (frame ID, data) for all frames kept raw by a
+        lazy load, ready to be written into a tag of the given config.
+
+        The frames get decoded first in case the config doesn't match
+        the version they were loaded from. The same goes for frames which
+        an eager load would have changed: frames which might get merged
+        with another one of the same ID and pictures still waiting for
+        their MIME type to get updated.
+        """
+
+        header = self._lazy_header
+        if not self._lazy_frames:
+            return []
+        elif header.version[1] != config.v2_version:
+            self._load_lazy()
+            return []
+
+        for frame_id, pending in list(iteritems(self._lazy_frames)):
+            if len(pending) > 1 or (
+                    frame_id == "APIC" and self._lazy_update and
+                    _apic_needs_update(pending[0])):
+                self._load_lazy(frame_id)
+
+        if config.v2_version == 4:
+            bits = 7
+        else:
+            bits = 8
+
+        framedata = []
+        for frame_id, pending in iteritems(self._lazy_frames):
+            name = frame_id.encode("ascii") if PY3 else frame_id
+            for tag, flags, raw_header, data in pending:
+                if config.v2_version == 4 and header.f_unsynch:
+                    # the tag wide unsynch flag doesn't get written, so
+                    # mark the frame data itself as unsynchronised
+                    flags |= Frame.FLAG24_UNSYNCH
+                datasize = BitPaddedInt.to_str(
+                    len(data), width=4, bits=bits)
+                framedata.append(
+                    (frame_id,
+                     struct.pack('>4s4sH', name, datasize, flags) + data))
+        return framedata
+
     def _write(self, config):
         # Sort frames by 'importance', then reverse frame size and then frame
         # hash to get a stable result
         order = ["TIT2", "TPE1", "TRCK", "TALB", "TPOS", "TDRC", "TCON"]
 
-        framedata = [
-            (f, save_frame(f, config=config)) for f in itervalues(self)]
+        # frames which were never accessed after a lazy load are written
+        # back as they were loaded
+        lazy_framedata = self._lazy_write(config)
 
-        def get_prio(frame):
+        framedata = []
+        for key in super(ID3Tags, self).keys():
+            f = self[key]
+            framedata.append(
+                (f.FrameID, f.HashKey, save_frame(f, config=config)))
+        framedata.extend((i, i, d) for (i, d) in lazy_framedata)
+
+        def get_prio(frame_id):
             try:
-                return order.index(frame.FrameID)
+                return order.index(frame_id)
             except ValueError:
                 return len(order)
 
         def sort_key(items):
-            frame, data = items
-            return (get_prio(frame), len(data), frame.HashKey)
+            frame_id, hash_key, data = items
+            return (get_prio(frame_id), len(data), hash_key)
 
-        framedata = [d for (f, d) in sorted(framedata, key=sort_key)]
+        framedata = [d for (i, k, d) in sorted(framedata, key=sort_key)]
 
         # only write unknown frames if they were loaded from the version
         # we are saving with. Theoretically we could upgrade frames
@@ -235,7 +383,8 @@ class ID3Tags(DictProxy, Tags):
             return [self[key]]
         else:
             key = key + ":"
-            return [v for s, v in self.items() if s.startswith(key)]
+            return [self[s] for s in super(ID3Tags, self).keys()
+                    if s.startswith(key)]
 
     def setall(self, key, values):
         """Delete frames of the given type and add frames in 'values'.
@@ -260,7 +409,7 @@ class ID3Tags(DictProxy, Tags):
             del(self[key])
         else:
             key = key + ":"
-            for k in list(self.keys()):
+            for k in list(super(ID3Tags, self).keys()):
                 if k.startswith(key):
                     del(self[k])
 
@@ -340,6 +489,7 @@ class ID3Tags(DictProxy, Tags):
     def __setitem__(self, key, tag):
         if not isinstance(tag, Frame):
             raise TypeError("%r not a Frame instance" % tag)
+        self._load_lazy(key)
         super(ID3Tags, self).__setitem__(key, tag)
 
     def __update_common(self):
@@ -349,6 +499,13 @@ class ID3Tags(DictProxy, Tags):
             # Get rid of "(xx)Foobr" format.
             self["TCON"].genres = self["TCON"].genres
 
+        if "APIC" in self._lazy_frames:
+            # don't decode all pictures just for this, but once they are
+            self._lazy_update = True
+        else:
+            self.__update_apic()
+
+    def __update_apic(self):
         mimes = {"PNG": "image/png", "JPG": "image/jpeg"}
         for pic in self.getall("APIC"):
             if pic.mime in mimes:
@@ -539,8 +696,27 @@ def save_frame(frame, name=None, config=None):
     return header + framedata
 
 
-def read_frames(id3, data, frames):
-    """Does not error out"""
+def _read_frame(id3, tag, flags, header, framedata, result,
+                unsupported_frames):
+    """Decodes a v2.3/v2.4 frame and appends it to `result`, or to
+    `unsupported_frames` if it can't be decoded. Does not error out.
+    """
+
+    try:
+        result.append(tag._fromData(id3, flags, framedata))
+    except NotImplementedError:
+        unsupported_frames.append(header + framedata)
+    except ID3JunkFrameError:
+        pass
+
+
+def read_frames(id3, data, frames, lazy_frames=None):
+    """Does not error out.
+
+    If `lazy_frames` is a dict, known v2.3/v2.4 frames don't get decoded
+    but are added to it instead, as frame ID -> list of
+    (frame class, flags, frame header, frame data).
+    """
 
     assert id3.version >= ID3Header._V22
 
@@ -553,24 +729,31 @@ def read_frames(id3, data, frames):
         except ValueError:
             pass
 
+    # Walk the frames by offset instead of re-slicing the remaining data
+    # after each frame, which would copy the rest of the tag every time.
+    offset = 0
+    end = len(data)
+
     if id3.version >= ID3Header._V23:
         if id3.version < ID3Header._V24:
             bpi = int
+        elif id3._bpi is not None:
+            bpi = id3._bpi
         else:
             bpi = determine_bpi(data, frames)
 
-        while data:
-            header = data[:10]
-            try:
-                name, size, flags = struct.unpack('>4sLH', header)
-            except struct.error:
+        while offset < end:
+            if end - offset < 10:
                 break  # not enough header
+            name, size, flags = struct.unpack_from('>4sLH', data, offset)
             if name.strip(b'\x00') == b'':
                 break
 
             size = bpi(size)
-            framedata = data[10:10 + size]
-            data = data[10 + size:]
+            header_start = offset
+            offset += 10
+            framedata = data[offset:offset + size]
+            offset += size
             if size == 0:
                 continue  # drop empty frames
 
@@ -589,27 +772,29 @@ def read_frames(id3, data, frames):
                 tag = frames[name]
             except KeyError:
                 if is_valid_frame_id(name):
-                    unsupported_frames.append(header + framedata)
+                    unsupported_frames.append(
+                        data[header_start:header_start + 10] + framedata)
             else:
-                try:
-                    result.append(tag._fromData(id3, flags, framedata))
-                except NotImplementedError:
-                    unsupported_frames.append(header + framedata)
-                except ID3JunkFrameError:
-                    pass
+                header = data[header_start:header_start + 10]
+                if lazy_frames is not None:
+                    lazy_frames.setdefault(name, []).append(
+                        (tag, flags, header, framedata))
+                else:
+                    _read_frame(id3, tag, flags, header, framedata, result,
+                                unsupported_frames)
     elif id3.version >= ID3Header._V22:
-        while data:
-            header = data[0:6]
-            try:
-                name, size = struct.unpack('>3s3s', header)
-            except struct.error:
+        while offset < end:
+            if end - offset < 6:
                 break  # not enough header
+            name, size = struct.unpack_from('>3s3s', data, offset)
             size, = struct.unpack('>L', b'\x00' + size)
             if name.strip(b'\x00') == b'':
                 break
 
-            framedata = data[6:6 + size]
-            data = data[6 + size:]
+            header_start = offset
+            offset += 6
+            framedata = data[offset:offset + size]
+            offset += size
             if size == 0:
                 continue  # drop empty frames
 
@@ -623,15 +808,17 @@ def read_frames(id3, data, frames):
                 tag = frames[name]
             except KeyError:
                 if is_valid_frame_id(name):
-                    unsupported_frames.append(header + framedata)
+                    unsupported_frames.append(
+                        data[header_start:header_start + 6] + framedata)
             else:
                 try:
                     result.append(
                         tag._fromData(id3, 0, framedata))
                 except (ID3EncryptionUnsupportedError,
                         NotImplementedError):
-                    unsupported_frames.append(header + framedata)
+                    unsupported_frames.append(
+                        data[header_start:header_start + 6] + framedata)
                 except ID3JunkFrameError:
                     pass
 
-    return result, unsupported_frames, data
+    return result, unsupported_frames, data[offset:]
@@ -9,10 +9,10 @@
 """MPEG audio stream information and tags."""
 
 import struct
+from array import array
 
 from mutagen import StreamInfo
-from mutagen._util import MutagenError, enum, BitReader, BitReaderError, \
-    convert_error
+from mutagen._util import MutagenError, enum, convert_error, loadfile
 from mutagen._compat import endswith, xrange
 from mutagen.id3 import ID3FileType, delete
 from mutagen.id3._util import BitPaddedInt
@@ -20,7 +20,7 @@ from mutagen.id3._util import BitPaddedInt
 from ._util import XingHeader, XingHeaderError, VBRIHeader, VBRIHeaderError
 
 
-__all__ = ["MP3", "Open", "delete", "MP3"]
+__all__ = ["MP3", "Open", "delete", "MP3", "MPEGSeekIndex"]
 
 
 class error(MutagenError):
@@ -78,6 +78,128 @@ def _guess_xing_bitrate_mode(xing):
 STEREO, JOINTSTEREO, DUALCHANNEL, MONO = xrange(4)
 
 
+def _build_header_table(bitrates, rates):
+    """Returns a list which maps bits 10 to 20 of a MPEG header (sample
+    rate index, bitrate index, protection bit, layer, version) to
+    (version, layer, bitrate, sample_rate, frame_size, slot, frame_length)
+    or None for invalid combinations. frame_length doesn't include padding
+    and has to be multiplied by slot.
+    """
+
+    table = []
+    for index in xrange(1 << 11):
+        sample_rate = index & 0x3
+        bitrate = (index >> 2) & 0xf
+        layer = (index >> 7) & 0x3
+        version = (index >> 9) & 0x3
+
+        # try to be strict here to reduce the chance of a false positive
+        if version == 1 or layer == 0 or sample_rate == 0x3 or \
+                bitrate == 0xf or bitrate == 0:
+            table.append(None)
+            continue
+
+        version = [2.5, None, 2, 1][version]
+        layer = 4 - layer
+        bitrate = bitrates[(version, layer)][bitrate] * 1000
+        sample_rate = rates[version][sample_rate]
+
+        if layer == 1:
+            frame_size = 384
+            slot = 4
+        elif version >= 2 and layer == 3:
+            frame_size = 576
+            slot = 1
+        else:
+            frame_size = 1152
+            slot = 1
+
+        frame_length = (frame_size // 8 * bitrate) // sample_rate
+        table.append(
+            (version, layer, bitrate, sample_rate, frame_size, slot,
+             frame_length))
+
+    return table
+
+
+def _get_offset_type():
+    """Returns an array type code for unsigned ints which can hold any file
+    offset or None if there is none.
+    """
+
+    for code in "LQ":
+        try:
+            if array(code).itemsize >= 8:
+                return code
+        except ValueError:
+            # no "Q" under Python 2
+            pass
+
+
+_OFFSET_TYPE = _get_offset_type()
+
+
+def _offset_array(values=()):
+    """Returns a sequence of file offsets, an array if possible"""
+
+    if _OFFSET_TYPE is None:
+        return list(values)
+    return array(_OFFSET_TYPE, values)
+
+
+class MPEGSeekIndex(object):
+    """MPEGSeekIndex()
+
+    Maps a play time to a file offset without decoding the audio data.
+
+    The offsets either come from the TOC of a Xing/VBRI header, in which
+    case they are spaced evenly in time and get interpolated, or from a
+    frame walk, in which case there is one entry for every audio frame
+    and the returned offsets are exact frame starts. Without both they
+    are estimated from the file size, assuming a constant bitrate.
+
+    Attributes:
+        interval (`float`): play time between two entries, in seconds
+        offsets (`array` or `list`): file offsets of the entries, the first
+            one is at 0 seconds
+        exact (`bool`): if the offsets are the starts of all audio frames
+    """
+
+    def __init__(self, interval, offsets, end, exact):
+        self.interval = interval
+        self.offsets = offsets
+        self.exact = exact
+        self._end = end
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def get_offset(self, seconds):
+        """Returns the file offset to start reading from for a play time.
+
+        Args:
+            seconds (`float`): play time in seconds
+        Returns:
+            `int`: the file offset
+        """
+
+        offsets = self.offsets
+        pos = max(seconds, 0) / self.interval
+        index = int(pos)
+        if index >= len(offsets):
+            return offsets[-1]
+
+        start = offsets[index]
+        if self.exact:
+            return start
+
+        if index + 1 < len(offsets):
+            end = offsets[index + 1]
+        else:
+            end = self._end
+        return start + int((end - start) * (pos - index))
+
+
 class MPEGFrame(object):
 
     # Map (version, layer) tuples to bitrates.
@@ -105,61 +227,87 @@ class MPEGFrame(object):
         2.5: [11025, 12000, 8000]
     }
 
+    _HEADERS = _build_header_table(__BITRATE, __RATES)
+
+    # the largest possible frame, including padding
+    _MAX_LENGTH = max(
+        (e[6] + 1) * e[5] for e in _HEADERS if e is not None)
+
+    _header = struct.Struct(">I")
+
+    @classmethod
+    def _probe(cls, data, index):
+        """Returns if `data` at `index` looks like the start of a valid
+        frame which is followed by another valid frame or contains a
+        Xing/VBRI header. Everything MPEGFrame/MPEGInfo would accept
+        passes, so this can be used to skip bad syncs without touching
+        the file.
+
+        Needs `_MAX_LENGTH + 4` bytes following the sync if available.
+        """
+
+        try:
+            header = cls._header.unpack_from(data, index)[0]
+        except struct.error:
+            return False
+        entry = cls._HEADERS[(header >> 10) & 0x7ff]
+        if header & 0xffe00000 != 0xffe00000 or entry is None:
+            return False
+
+        slot, frame_length = entry[5:]
+        next_index = index + (frame_length + ((header >> 9) & 0x1)) * slot
+        try:
+            header = cls._header.unpack_from(data, next_index)[0]
+        except struct.error:
+            pass
+        else:
+            if header & 0xffe00000 == 0xffe00000 and \
+                    cls._HEADERS[(header >> 10) & 0x7ff] is not None:
+                return True
+
+        # a single frame can still be enough if it has a VBR header
+        if entry[1] == 3:
+            vbr_data = data[index:index + 40]
+            for marker in (b"Xing", b"Info", b"VBRI"):
+                if marker in vbr_data:
+                    return True
+
+        return False
+
     sketchy = False
 
+    # number of samples to skip according to the LAME header
+    _encoder_skip = 0
+
     def __init__(self, fileobj):
         """Raises HeaderNotFoundError"""
 
         self.frame_offset = fileobj.tell()
 
-        r = BitReader(fileobj)
-        try:
-            if r.bits(11) != 0x7ff:
-                raise HeaderNotFoundError("invalid sync")
-            version = r.bits(2)
-            layer = r.bits(2)
-            protection = r.bits(1)
-            bitrate = r.bits(4)
-            sample_rate = r.bits(2)
-            padding = r.bits(1)
-            r.skip(1)  # private
-            self.mode = r.bits(2)
-            r.skip(6)
-        except BitReaderError:
+        data = fileobj.read(4)
+        if len(data) != 4:
             raise HeaderNotFoundError("truncated header")
 
-        assert r.get_position() == 32 and r.is_aligned()
+        header = self._header.unpack(data)[0]
+        if header & 0xffe00000 != 0xffe00000:
+            raise HeaderNotFoundError("invalid sync")
 
-        # try to be strict here to redice the chance of a false positive
-        if version == 1 or layer == 0 or sample_rate == 0x3 or \
-                bitrate == 0xf or bitrate == 0:
+        entry = self._HEADERS[(header >> 10) & 0x7ff]
+        if entry is None:
             raise HeaderNotFoundError("invalid header")
 
-        self.channels = 1 if self.mode == MONO else 2
+        self.version, self.layer, self.bitrate, self.sample_rate, \
+            frame_size, slot, frame_length = entry
 
-        self.version = [2.5, None, 2, 1][version]
-        self.layer = 4 - layer
-        self.protected = not protection
+        padding = (header >> 9) & 0x1
+        self.mode = (header >> 6) & 0x3
+        self.channels = 1 if self.mode == MONO else 2
+        self.protected = not (header >> 16) & 0x1
         self.padding = bool(padding)
 
-        self.bitrate = self.__BITRATE[(self.version, self.layer)][bitrate]
-        self.bitrate *= 1000
-        self.sample_rate = self.__RATES[self.version][sample_rate]
-
-        if self.layer == 1:
-            frame_size = 384
-            slot = 4
-        elif self.version >= 2 and self.layer == 3:
-            frame_size = 576
-            slot = 1
-        else:
-            frame_size = 1152
-            slot = 1
-
-        frame_length = (
-            ((frame_size // 8 * self.bitrate) // self.sample_rate) +
-            padding) * slot
+        frame_length = (frame_length + padding) * slot
 
+        self._frame_samples = frame_size
         self.sketchy = True
 
         # Try to find/parse the Xing header, which trumps the above length
@@ -183,11 +331,12 @@ class MPEGFrame(object):
             lame = xing.lame_header
             self.sketchy = False
             self.bitrate_mode = _guess_xing_bitrate_mode(xing)
+            if lame is not None:
+                self._encoder_skip = \
+                    lame.encoder_delay_start + lame.encoder_padding_end
             if xing.frames != -1:
                 samples = frame_size * xing.frames
-                if lame is not None:
-                    samples -= lame.encoder_delay_start
-                    samples -= lame.encoder_padding_end
+                samples -= self._encoder_skip
                 self.length = float(samples) / self.sample_rate
             if xing.bytes != -1 and self.length:
                 self.bitrate = int((xing.bytes * 8) / self.length)
@@ -197,6 +346,14 @@ class MPEGFrame(object):
                 self.track_gain = lame.track_gain_adjustment
                 self.track_peak = lame.track_peak
                 self.album_gain = lame.album_gain_adjustment
+            if len(xing.toc) == 100 and xing.bytes != -1 and self.length:
+                # entry i contains the offset at i% of the play time in
+                # units of 1/256 of the stream size
+                offsets = _offset_array([
+                    frame_offset + (e * xing.bytes) // 256 for e in xing.toc])
+                self._seek_index = MPEGSeekIndex(
+                    self.length / 100.0, offsets,
+                    frame_offset + xing.bytes, False)
             return
 
         # VBRI
@@ -213,6 +370,14 @@ class MPEGFrame(object):
             self.length = float(frame_size * vbri.frames) / self.sample_rate
             if self.length:
                 self.bitrate = int((vbri.bytes * 8) / self.length)
+            if vbri.toc and vbri.toc_frames:
+                # entries contain the size of the next toc_frames frames
+                offsets = _offset_array([frame_offset])
+                for size in vbri.toc[:-1]:
+                    offsets.append(offsets[-1] + size * vbri.toc_scale_factor)
+                self._seek_index = MPEGSeekIndex(
+                    float(frame_size * vbri.toc_frames) / self.sample_rate,
+                    offsets, frame_offset + vbri.bytes, False)
 
 
 def skip_id3(fileobj):
@@ -233,47 +398,77 @@ def skip_id3(fileobj):
             break
 
 
-def iter_sync(fileobj, max_read):
-    """Iterate over a fileobj and yields on each mpeg sync.
+def _iter_sync_data(fileobj, max_read, lookahead=0, block_size=65536):
+    """Iterate over the next `max_read` bytes of a fileobj and yield
+    (data, index, offset) on each mpeg sync. `data[index:]` starts with the
+    sync, `offset` is the file offset of the sync. Unless the end of the
+    file is reached `data` contains at least `lookahead` bytes following
+    the two sync bytes.
 
-    When yielding the fileobj offset is right before the sync and can be
-    changed between iterations without affecting the iteration process.
+    The file gets read in blocks of `block_size` bytes. The fileobj offset
+    can be changed between iterations without affecting the iteration
+    process.
 
     Might raise IOError.
     """
 
-    read = 0
-    size = 2
-    last_byte = b""
-    is_second = lambda b: ord(b) & 0xe0 == 0xe0
+    assert block_size > lookahead + 1
 
-    while read < max_read:
-        data_offset = fileobj.tell()
-        new_data = fileobj.read(min(max_read - read, size))
-        if not new_data:
-            return
-        read += len(new_data)
+    start = fileobj.tell()
+    # syncs (both bytes) have to be in the first max_read bytes
+    sync_end = start + max_read - 1
+    # no need to read past this point
+    read_end = sync_end + 1 + lookahead
 
-        if last_byte == b"\xff" and is_second(new_data[0:1]):
-            fileobj.seek(data_offset - 1, 0)
-            yield
+    data = b""
+    data_offset = start
+    pos = 0
+    eof = False
 
-        size *= 2
-        last_byte = new_data[-1:]
+    while True:
+        if not eof:
+            read_offset = data_offset + len(data)
+            fileobj.seek(read_offset, 0)
+            size = min(block_size, read_end - read_offset)
+            new_data = fileobj.read(size)
+            eof = len(new_data) < size or read_offset + size >= read_end
+            data = data[pos:] + new_data
+            data_offset += pos
+            pos = 0
+
+        # only look at syncs which have enough data following them, the
+        # rest will be looked at again after the next read
+        if eof:
+            limit = len(data) - 1
+        else:
+            limit = len(data) - 1 - lookahead
+        limit = min(limit, sync_end - data_offset)
 
-        find_offset = 0
-        while True:
-            index = new_data.find(b"\xff", find_offset)
-            # if not found or the last byte -> read more
-            if index == -1 or index == len(new_data) - 1:
+        while pos < limit:
+            index = data.find(b"\xff", pos, limit)
+            if index == -1:
+                pos = limit
                 break
+            if ord(data[index + 1:index + 2]) & 0xe0 == 0xe0:
+                yield data, index, data_offset + index
+            pos = index + 1
+
+        if eof:
+            return
+
+
+def iter_sync(fileobj, max_read):
+    """Iterate over a fileobj and yields on each mpeg sync.
+
+    When yielding the fileobj offset is right before the sync and can be
+    changed between iterations without affecting the iteration process.
 
-            if is_second(new_data[index + 1:index + 2]):
-                fileobj.seek(data_offset + index, 0)
-                yield
-            find_offset = index + 1
+    Might raise IOError.
+    """
 
-        fileobj.seek(data_offset + len(new_data), 0)
+    for data, index, offset in _iter_sync_data(fileobj, max_read):
+        fileobj.seek(offset, 0)
+        yield
 
 
 class MPEGInfo(StreamInfo):
@@ -303,6 +498,13 @@ class MPEGInfo(StreamInfo):
         track_peak (`float` or `None`): replaygain track peak or None
         album_gain (`float` or `None`): replaygain album gain (89db) or None
 
+    Attributes only available with ``accurate_length=True``, `None`
+    otherwise:
+
+    Attributes:
+        total_frames (`int`): number of audio frames
+        total_samples (`int`): number of audio samples per channel
+
     Useless attributes:
 
     Attributes:
@@ -318,9 +520,15 @@ class MPEGInfo(StreamInfo):
     encoder_info = u""
     bitrate_mode = BitrateMode.UNKNOWN
     track_gain = track_peak = album_gain = album_peak = None
+    total_frames = total_samples = None
+    _encoder_skip = 0
+
+    # the file offsets of all audio frames, if they were walked
+    _frame_offsets = None
+    _seek_index = None
 
     @convert_error(IOError, error)
-    def __init__(self, fileobj, offset=None):
+    def __init__(self, fileobj, offset=None, accurate_length=False):
         """Parse MPEG stream information from a file-like object.
 
         If an offset argument is given, it is used to start looking
@@ -328,6 +536,10 @@ class MPEGInfo(StreamInfo):
         will be skipped automatically. A correct offset can make
         loading files significantly faster.
 
+        If accurate_length is True, all frame headers get read and the
+        length and bitrate are calculated from them instead of being
+        estimated or taken from a VBR header.
+
         Raises HeaderNotFoundError, error
         """
 
@@ -349,11 +561,18 @@ class MPEGInfo(StreamInfo):
         frames = []
         first_frame = None
 
-        for _ in iter_sync(fileobj, max_read):
+        lookahead = MPEGFrame._MAX_LENGTH + 4
+        for data, index, offset in _iter_sync_data(
+                fileobj, max_read, lookahead):
             max_syncs -= 1
             if max_syncs <= 0:
                 break
 
+            # check the header and the following one in memory first
+            if not MPEGFrame._probe(data, index):
+                continue
+
+            fileobj.seek(offset, 0)
             for _ in xrange(enough_frames):
                 try:
                     frame = MPEGFrame(fileobj)
@@ -392,6 +611,8 @@ class MPEGInfo(StreamInfo):
         sketchy = self.sketchy
         self.__dict__.update(first_frame.__dict__)
         self.sketchy = sketchy
+        # the first frame only contains the Xing/VBRI header
+        self._vbr_header = not first_frame.sketchy
 
         # no length, estimate based on file size
         if self.length == -1:
@@ -399,6 +620,110 @@ class MPEGInfo(StreamInfo):
             content_size = fileobj.tell() - first_frame.frame_offset
             self.length = 8 * content_size / float(self.bitrate)
 
+        # no TOC, spread the offsets evenly over the rest of the file
+        if self._seek_index is None and self.length > 0:
+            fileobj.seek(0, 2)
+            start = self.frame_offset
+            content_size = fileobj.tell() - start
+            offsets = _offset_array(
+                [start + (content_size * i) // 100 for i in xrange(100)])
+            self._seek_index = MPEGSeekIndex(
+                self.length / 100.0, offsets, start + content_size, False)
+
+        if accurate_length:
+            self._walk_frames(fileobj)
+
+    @convert_error(IOError, error)
+    def _walk_frames(self, fileobj, block_size=65536):
+        """Reads all frame headers starting with the first frame and
+        updates the length and bitrate from them.
+        """
+
+        table = MPEGFrame._HEADERS
+        unpack_from = MPEGFrame._header.unpack_from
+        lookahead = MPEGFrame._MAX_LENGTH + 4
+
+        fileobj.seek(0, 2)
+        end = fileobj.tell()
+
+        offsets = _offset_array()
+        samples = 0
+        bitrates = set()
+        offset = self.frame_offset
+        data = b""
+        data_offset = offset
+
+        while offset + 4 <= end:
+            pos = offset - data_offset
+            if pos + 4 > len(data):
+                fileobj.seek(offset, 0)
+                data = fileobj.read(block_size)
+                data_offset = offset
+                pos = 0
+                if len(data) < 4:
+                    break
+
+            header = unpack_from(data, pos)[0]
+            entry = table[(header >> 10) & 0x7ff]
+            if header & 0xffe00000 != 0xffe00000 or entry is None:
+                # junk in between frames or at the end (tags etc.),
+                # try to find the next frame
+                fileobj.seek(offset + 1, 0)
+                for sync_data, index, sync_offset in _iter_sync_data(
+                        fileobj, end - offset - 1, lookahead):
+                    if MPEGFrame._probe(sync_data, index):
+                        offset = sync_offset
+                        break
+                else:
+                    break
+                continue
+
+            frame_length = (entry[6] + ((header >> 9) & 0x1)) * entry[5]
+            if offset + frame_length > end:
+                break
+            if not offsets:
+                first_samples = entry[4]
+            offsets.append(offset)
+            samples += entry[4]
+            bitrates.add(entry[2])
+            offset += frame_length
+
+        if self._vbr_header and offsets:
+            samples -= first_samples
+            del offsets[0]
+
+        if not offsets:
+            return
+
+        samples = max(samples - self._encoder_skip, 0)
+        self.total_frames = len(offsets)
+        self.total_samples = samples
+        self._frame_offsets = offsets
+        self._seek_index = MPEGSeekIndex(
+            float(self._frame_samples) / self.sample_rate, offsets, offset,
+            True)
+        self.length = float(samples) / self.sample_rate
+        if self.length:
+            self.bitrate = int((offset - offsets[0]) * 8 / self.length)
+        if self.bitrate_mode == BitrateMode.UNKNOWN:
+            if len(bitrates) > 1:
+                self.bitrate_mode = BitrateMode.VBR
+            else:
+                self.bitrate_mode = BitrateMode.CBR
+
+    def seek_index(self):
+        """Returns an index mapping play time to file offsets.
+
+        With ``accurate_length=True`` the index is built from the frame
+        walk, otherwise from the TOC of a Xing or VBRI header if present,
+        or from the file size assuming a constant bitrate.
+
+        Returns:
+            `MPEGSeekIndex` or `None` if the stream has no length
+        """
+
+        return self._seek_index
+
     def pprint(self):
         info = str(self.bitrate_mode).split(".", 1)[-1]
         if self.bitrate_mode == BitrateMode.UNKNOWN:
@@ -414,12 +739,14 @@ class MPEGInfo(StreamInfo):
 
 
 class MP3(ID3FileType):
-    """MP3(filething)
+    """MP3(filething, accurate_length=False)
 
     An MPEG audio (usually MPEG-1 Layer 3) file.
 
     Arguments:
         filething (filething)
+        accurate_length (bool): read all frame headers to get the exact
+            length and bitrate, see `MPEGInfo`
 
     Attributes:
         info (`MPEGInfo`)
@@ -430,6 +757,14 @@ class MP3(ID3FileType):
 
     _mimes = ["audio/mpeg", "audio/mpg", "audio/x-mpeg"]
 
+    @loadfile()
+    def load(self, filething, ID3=None, accurate_length=False, **kwargs):
+        # see __init__ for docs
+
+        super(MP3, self).load(filething, ID3, **kwargs)
+        if accurate_length:
+            self.info._walk_frames(filething.fileobj)
+
     @property
     def mime(self):
         l = self.info.layer
@@ -25,11 +25,14 @@ were all consulted.
 
 import struct
 import sys
+from array import array
+from functools import partial
+from operator import add
 
 from mutagen import FileType, Tags, StreamInfo, PaddingInfo
 from mutagen._constants import GENRES
-from mutagen._util import cdata, insert_bytes, DictProxy, MutagenError, \
-    hashable, enum, get_size, resize_bytes, loadfile, convert_error
+from mutagen._util import cdata, EditPlan, DictProxy, MutagenError, \
+    hashable, enum, get_size, loadfile, convert_error
 from mutagen._compat import (reraise, PY2, string_types, text_type, chr_,
                              iteritems, PY3, cBytesIO, izip, xrange)
 from ._atom import Atoms, Atom, AtomError
@@ -216,6 +219,24 @@ def _key2name(key):
     return key.encode("latin-1")
 
 
+def _get_array_type(size):
+    """Returns an array type code for unsigned ints of `size` bytes or None
+    if there is none.
+    """
+
+    for code in "ILQ":
+        try:
+            if array(code).itemsize == size:
+                return code
+        except ValueError:
+            # no "Q" under Python 2
+            pass
+
+
+# number of table entries to process at once when updating offsets
+_OFFSET_CHUNK_ENTRIES = 2 ** 16
+
+
 def _find_padding(atom_path):
     # Check for padding "free" atom
     # XXX: we only use them if they are adjacent to ilst, and only one.
@@ -399,15 +420,22 @@ class MP4Tags(DictProxy, Tags):
 
         data = Atom.render(b"ilst", b"".join(values))
 
-        # Find the old atoms.
+        # Find the old atoms. Containers outside of moov get parsed
+        # lazily, so errors can also happen while saving.
         try:
             atoms = Atoms(filething.fileobj)
+            self.__save(filething.fileobj, atoms, data, padding)
         except AtomError as err:
             reraise(error, err, sys.exc_info()[2])
 
-        self.__save(filething.fileobj, atoms, data, padding)
-
     def __save(self, fileobj, atoms, data, padding):
+        # moof gets parsed lazily, but the tfhd offsets updated after
+        # resizing refer to the old file layout, so parse it now
+        try:
+            atoms[b"moof"].children
+        except KeyError:
+            pass
+
         try:
             path = atoms.path(b"moov", b"udta", b"meta", b"ilst")
         except KeyError:
@@ -443,10 +471,10 @@ class MP4Tags(DictProxy, Tags):
         else:
             data = meta
 
-        insert_bytes(fileobj, len(data), offset)
-        fileobj.seek(offset)
-        fileobj.write(data)
-        self.__update_parents(fileobj, path, len(data))
+        plan = EditPlan(fileobj)
+        plan.insert(offset, data)
+        self.__update_parents(fileobj, plan, path, len(data))
+        plan.apply()
         self.__update_offsets(fileobj, atoms, len(data), offset)
 
     def __save_existing(self, fileobj, atoms, path, ilst_data, padding_func):
@@ -473,16 +501,16 @@ class MP4Tags(DictProxy, Tags):
 
         ilst_data += Atom.render(b"free", b"\x00" * new_padding)
 
-        resize_bytes(fileobj, length, len(ilst_data), offset)
         delta = len(ilst_data) - length
 
-        fileobj.seek(offset)
-        fileobj.write(ilst_data)
-        self.__update_parents(fileobj, path[:-1], delta)
+        plan = EditPlan(fileobj)
+        plan.replace(offset, length, ilst_data)
+        self.__update_parents(fileobj, plan, path[:-1], delta)
+        plan.apply()
         self.__update_offsets(fileobj, atoms, delta, offset)
 
-    def __update_parents(self, fileobj, path, delta):
-        """Update all parent atoms with the new size."""
+    def __update_parents(self, fileobj, plan, path, delta):
+        """Add the new sizes of all parent atoms to the EditPlan."""
 
         if delta == 0:
             return
@@ -493,23 +521,63 @@ class MP4Tags(DictProxy, Tags):
             if size == 1:  # 64bit
                 # skip name (4B) and read size (8B)
                 size = cdata.ulonglong_be(fileobj.read(12)[4:])
-                fileobj.seek(atom.offset + 8)
-                fileobj.write(cdata.to_ulonglong_be(size + delta))
+                plan.write(
+                    atom.offset + 8, cdata.to_ulonglong_be(size + delta))
             else:  # 32bit
-                fileobj.seek(atom.offset)
-                fileobj.write(cdata.to_uint_be(size + delta))
+                plan.write(atom.offset, cdata.to_uint_be(size + delta))
+
+    def __update_offset_table(self, fileobj, size, atom, delta, offset):
+        """Update offset table in the specified atom. `size` is the size
+        of an entry in bytes, 4 for stco and 8 for co64.
+        """
 
-    def __update_offset_table(self, fileobj, fmt, atom, delta, offset):
-        """Update offset table in the specified atom."""
         if atom.offset > offset:
             atom.offset += delta
         fileobj.seek(atom.offset + 12)
-        data = fileobj.read(atom.length - 12)
-        fmt = fmt % cdata.uint_be(data[:4])
-        offsets = struct.unpack(fmt, data[4:])
-        offsets = [o + (0, delta)[offset < o] for o in offsets]
-        fileobj.seek(atom.offset + 16)
-        fileobj.write(struct.pack(fmt, *offsets))
+        count = cdata.uint_be(fileobj.read(4))
+        count = min(count, (atom.length - 16) // size)
+
+        typecode = _get_array_type(size)
+        swap = sys.byteorder == "little"
+        fmt = ">%d" + {4: "I", 8: "Q"}[size]
+        shift = partial(add, delta)
+
+        # work on bounded chunks to keep memory usage low for large tables
+        pos = atom.offset + 16
+        end = pos + count * size
+        while pos < end:
+            fileobj.seek(pos)
+            data = fileobj.read(min(_OFFSET_CHUNK_ENTRIES * size, end - pos))
+            if not data:
+                break
+            data = data[:len(data) - len(data) % size]
+            if typecode is not None:
+                offsets = array(typecode, data)
+                if swap:
+                    offsets.byteswap()
+            else:
+                offsets = struct.unpack(fmt % (len(data) // size), data)
+
+            if min(offsets) > offset:
+                offsets = list(map(shift, offsets))
+            elif max(offsets) > offset:
+                offsets = [o + (0, delta)[offset < o] for o in offsets]
+            else:
+                # nothing changed
+                pos += len(data)
+                continue
+
+            if typecode is not None:
+                offsets = array(typecode, offsets)
+                if swap:
+                    offsets.byteswap()
+                new_data = offsets.tostring() if PY2 else offsets.tobytes()
+            else:
+                new_data = struct.pack(fmt % len(offsets), *offsets)
+
+            fileobj.seek(pos)
+            fileobj.write(new_data)
+            pos += len(data)
 
     def __update_tfhd(self, fileobj, atom, delta, offset):
         if atom.offset > offset:
@@ -530,9 +598,9 @@ class MP4Tags(DictProxy, Tags):
             return
         moov = atoms[b"moov"]
         for atom in moov.findall(b'stco', True):
-            self.__update_offset_table(fileobj, ">%dI", atom, delta, offset)
+            self.__update_offset_table(fileobj, 4, atom, delta, offset)
         for atom in moov.findall(b'co64', True):
-            self.__update_offset_table(fileobj, ">%dQ", atom, delta, offset)
+            self.__update_offset_table(fileobj, 8, atom, delta, offset)
         try:
             for atom in atoms[b"moof"].findall(b'tfhd', True):
                 self.__update_tfhd(fileobj, atom, delta, offset)
@@ -987,7 +1055,7 @@ class MP4(FileType):
 
     _mimes = ["audio/mp4", "audio/x-m4a", "audio/mpeg4", "audio/aac"]
 
-    @loadfile()
+    @loadfile(cached=True)
     def load(self, filething):
         fileobj = filething.fileobj
 
@@ -32,13 +32,17 @@ class Atom(object):
     name -- four byte name of the atom, as a str
     offset -- location in the constructor-given fileobj of this atom
 
+    If lazy is True the children of a container atom get parsed on first
+    access of 'children', which requires the fileobj to still be usable.
+
     This structure should only be used internally by Mutagen.
     """
 
-    children = None
+    _children = None
+    _lazy_fileobj = None
 
     @convert_error(IOError, AtomError)
-    def __init__(self, fileobj, level=0):
+    def __init__(self, fileobj, level=0, lazy=False):
         """May raise AtomError"""
 
         self.offset = fileobj.tell()
@@ -69,14 +73,37 @@ class Atom(object):
             raise AtomError(
                 "atom length can only be 0, 1 or 8 and higher")
 
-        if self.name in _CONTAINERS:
-            self.children = []
-            fileobj.seek(_SKIP_SIZE.get(self.name, 0), 1)
-            while fileobj.tell() < self.offset + self.length:
-                self.children.append(Atom(fileobj, level + 1))
+        if self.name in _CONTAINERS and not lazy:
+            self._children = self._read_children(fileobj, level)
         else:
+            if self.name in _CONTAINERS:
+                self._lazy_fileobj = fileobj
+                self._level = level
             fileobj.seek(self.offset + self.length, 0)
 
+    @property
+    def children(self):
+        if self._lazy_fileobj is not None:
+            fileobj = self._lazy_fileobj
+            self._lazy_fileobj = None
+            self._children = self._read_children(fileobj, self._level)
+        return self._children
+
+    @children.setter
+    def children(self, value):
+        self._lazy_fileobj = None
+        self._children = value
+
+    @convert_error(IOError, AtomError)
+    def _read_children(self, fileobj, level):
+        """Returns a list of all child atoms, May raise AtomError"""
+
+        children = []
+        fileobj.seek(self._dataoffset + _SKIP_SIZE.get(self.name, 0), 0)
+        while fileobj.tell() < self.offset + self.length:
+            children.append(Atom(fileobj, level + 1))
+        return children
+
     @property
     def datalength(self):
         return self.length - (self._dataoffset - self.offset)
@@ -125,11 +152,12 @@ class Atom(object):
 
     def __repr__(self):
         cls = self.__class__.__name__
-        if self.children is None:
+        # don't trigger parsing of lazy children here
+        if self._children is None:
             return "<%s name=%r length=%r offset=%r>" % (
                 cls, self.name, self.length, self.offset)
         else:
-            children = "\n".join([" " + line for child in self.children
+            children = "\n".join([" " + line for child in self._children
                                   for line in repr(child).splitlines()])
             return "<%s name=%r length=%r offset=%r\n%s>" % (
                 cls, self.name, self.length, self.offset, children)
@@ -141,6 +169,10 @@ class Atoms(object):
     Attributes:
     atoms -- a list of top-level atoms as Atom objects
 
+    Only 'moov' gets parsed completely, all other top-level containers
+    (e.g. the 'moof' atoms of fragmented files) get parsed when their
+    children are accessed, which requires the fileobj to still be usable.
+
     This structure should only be used internally by Mutagen.
     """
 
@@ -151,7 +183,12 @@ class Atoms(object):
         end = fileobj.tell()
         fileobj.seek(0)
         while fileobj.tell() + 8 <= end:
-            self.atoms.append(Atom(fileobj))
+            atom = Atom(fileobj, lazy=True)
+            if atom.name == b"moov":
+                # always needed for tags and stream info, parse right away
+                atom.children
+                fileobj.seek(atom.offset + atom.length, 0)
+            self.atoms.append(atom)
 
     def path(self, *names):
         """Look up and return the complete path of an atom.
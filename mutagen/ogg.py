@@ -21,8 +21,8 @@ import sys
 import zlib
 
 from mutagen import FileType
-from mutagen._util import cdata, resize_bytes, MutagenError, loadfile, seek_end
-from ._compat import cBytesIO, reraise, chr_, izip, xrange
+from mutagen._util import cdata, EditPlan, MutagenError, loadfile
+from ._compat import reraise, chr_, izip, xrange
 
 
 class error(MutagenError):
@@ -31,6 +31,53 @@ class error(MutagenError):
     pass
 
 
+def _page_crc(data):
+    """Returns the CRC of a page as written in the header, `data` has to be
+    the full page with the CRC field set to zero.
+    """
+
+    # Python's CRC is swapped relative to Ogg's needs.
+    # crc32 returns uint prior to py2.6 on some platforms, so force uint
+    crc = (~zlib.crc32(data.translate(cdata.bitswap), -1)) & 0xffffffff
+    # Although we're using to_uint_be, this actually makes the CRC
+    # a proper le integer, since Python's CRC is byteswapped.
+    return cdata.to_uint_be(crc).translate(cdata.bitswap)
+
+
+def _parse_lacings(lacing_bytes):
+    """Returns a list of packet sizes and if the last packet is complete"""
+
+    total = 0
+    lacings = []
+    for c in bytearray(lacing_bytes):
+        total += c
+        if c < 255:
+            lacings.append(total)
+            total = 0
+    if total:
+        lacings.append(total)
+        return lacings, False
+    return lacings, True
+
+
+def _split_packets(data, offset, lacings):
+    """Returns the packets with the sizes `lacings` from `data`
+    starting at `offset`.
+    """
+
+    packets = []
+    for l in lacings:
+        packets.append(bytes(data[offset:offset + l]))
+        offset += l
+    return packets
+
+
+_MAX_PAGE_SIZE = 27 + 255 + 255 * 255
+
+# Needs to be larger than the maximum page size
+_RENUMBER_BLOCK_SIZE = 2 ** 20
+
+
 class OggPage(object):
     """A single Ogg page (not necessarily a single encoded packet).
 
@@ -95,23 +142,124 @@ class OggPage(object):
         if self.version != 0:
             raise error("version %r unsupported" % self.version)
 
-        total = 0
-        lacings = []
         lacing_bytes = fileobj.read(segments)
         if len(lacing_bytes) != segments:
             raise error("unable to read %r lacing bytes" % segments)
-        for c in bytearray(lacing_bytes):
-            total += c
-            if c < 255:
-                lacings.append(total)
-                total = 0
-        if total:
-            lacings.append(total)
-            self.complete = False
+        lacings, self.complete = _parse_lacings(lacing_bytes)
 
-        self.packets = [fileobj.read(l) for l in lacings]
-        if [len(p) for p in self.packets] != lacings:
+        size = sum(lacings)
+        data = fileobj.read(size)
+        if len(data) != size:
             raise error("unable to read full data")
+        self.packets = _split_packets(data, 0, lacings)
+
+    @classmethod
+    def from_buffer(cls, buf, offset=0, check_crc=False):
+        """Parse a page from `buf` starting at `offset`.
+
+        The 'offset' attribute of the returned page is set to `offset`.
+
+        Args:
+            buf (`bytes`): the data containing the page
+            offset (`int`): the offset of the page in `buf`
+            check_crc (`bool`): if the page checksum should be verified
+        Returns:
+            `OggPage`
+        Raises:
+            error: in case the page is invalid, truncated or the
+                checksum doesn't match
+            EOFError: in case `offset` is at the end of `buf`
+        """
+
+        return cls._from_buffer(buf, offset, check_crc)[0]
+
+    @classmethod
+    def _from_buffer(cls, buf, offset, check_crc):
+        """Like from_buffer() but returns a tuple of the page and the
+        offset in `buf` right after it.
+        """
+
+        if offset >= len(buf):
+            raise EOFError
+
+        self = cls()
+        self.offset = offset
+
+        try:
+            (oggs, self.version, self.__type_flags,
+             self.position, self.serial, self.sequence,
+             crc, segments) = struct.unpack_from("<4sBBqIIiB", buf, offset)
+        except struct.error:
+            raise error("unable to read full header; got %r" %
+                        bytes(buf[offset:offset + 27]))
+
+        if oggs != b"OggS":
+            raise error("read %r, expected %r, at 0x%x" % (
+                oggs, b"OggS", offset))
+
+        if self.version != 0:
+            raise error("version %r unsupported" % self.version)
+
+        data_start = offset + 27 + segments
+        lacing_bytes = buf[offset + 27:data_start]
+        if len(lacing_bytes) != segments:
+            raise error("unable to read %r lacing bytes" % segments)
+        lacings, self.complete = _parse_lacings(lacing_bytes)
+
+        end = data_start + sum(lacings)
+        if end > len(buf):
+            raise error("unable to read full data")
+
+        if check_crc:
+            data = bytes(buf[offset:end])
+            if _page_crc(data[:22] + b"\x00" * 4 + data[26:]) != data[22:26]:
+                raise error("CRC mismatch at 0x%x" % offset)
+
+        self.packets = _split_packets(buf, data_start, lacings)
+        return self, end
+
+    @staticmethod
+    def iter_pages(fileobj, bufsize=2 ** 16, check_crc=False):
+        """Iterate over all pages starting at the current position of
+        `fileobj`, reading it in blocks of `bufsize` bytes.
+
+        The 'offset' attribute of the pages is set to their file offset.
+        The position of `fileobj` is undefined while iterating.
+
+        Args:
+            fileobj (fileobj)
+            bufsize (`int`): the size of the blocks to read
+            check_crc (`bool`): if the page checksums should be verified
+        Yields:
+            `OggPage`
+        Raises:
+            error: in case invalid data is found
+            IOError
+        """
+
+        buf_offset = fileobj.tell()
+        buf = b""
+        pos = 0
+        eof = False
+        while True:
+            try:
+                page, end = OggPage._from_buffer(buf, pos, check_crc)
+            except (error, EOFError):
+                # maybe the page continues in the next block
+                if eof or len(buf) - pos >= _MAX_PAGE_SIZE:
+                    if pos < len(buf):
+                        raise
+                    break
+                buf_offset += pos
+                fileobj.seek(buf_offset + len(buf) - pos, 0)
+                data = fileobj.read(bufsize)
+                eof = len(data) < bufsize
+                buf = buf[pos:] + data
+                pos = 0
+                continue
+            page.offset += buf_offset
+            pos = end
+            yield page
 
     def __eq__(self, other):
         """Two Ogg pages are the same if they write the same data."""
@@ -154,14 +302,7 @@ class OggPage(object):
         data.extend(self.packets)
         data = b"".join(data)
 
-        # Python's CRC is swapped relative to Ogg's needs.
-        # crc32 returns uint prior to py2.6 on some platforms, so force uint
-        crc = (~zlib.crc32(data.translate(cdata.bitswap), -1)) & 0xffffffff
-        # Although we're using to_uint_be, this actually makes the CRC
-        # a proper le integer, since Python's CRC is byteswapped.
-        crc = cdata.to_uint_be(crc).translate(cdata.bitswap)
-        data = data[:22] + crc + data[26:]
-        return data
+        return data[:22] + _page_crc(data) + data[26:]
 
     @property
     def size(self):
@@ -221,23 +362,48 @@ class OggPage(object):
         does not change the total file size).
         """
 
+        # Pages get read, renumbered in memory and written back in
+        # blocks which can hold at least one page of the maximum size.
         number = start
+        offset = fileobj.tell()
         while True:
-            try:
-                page = OggPage(fileobj)
-            except EOFError:
-                break
-            else:
-                if page.serial != serial:
-                    # Wrong stream, skip this page.
-                    continue
-                # Changing the number can't change the page size,
-                # so seeking back based on the current size is safe.
-                fileobj.seek(-page.size, 1)
-            page.sequence = number
-            fileobj.write(page.write())
-            fileobj.seek(page.offset + page.size, 0)
-            number += 1
+            fileobj.seek(offset, 0)
+            data = bytearray(fileobj.read(_RENUMBER_BLOCK_SIZE))
+            changed = False
+            pos = 0
+            while pos + 27 <= len(data):
+                if data[pos:pos + 5] != b"OggS\x00":
+                    break
+                lacing_end = pos + 27 + data[pos + 26]
+                if lacing_end > len(data):
+                    break
+                page_end = lacing_end + sum(data[pos + 27:lacing_end])
+                if page_end > len(data):
+                    break
+                if cdata.uint_le(bytes(data[pos + 14:pos + 18])) == serial:
+                    data[pos + 18:pos + 26] = \
+                        cdata.to_int_le(number) + b"\x00" * 4
+                    data[pos + 22:pos + 26] = _page_crc(
+                        bytes(data[pos:page_end]))
+                    number += 1
+                    changed = True
+                pos = page_end
+
+            if changed:
+                fileobj.seek(offset, 0)
+                fileobj.write(bytes(data[:pos]))
+            offset += pos
+
+            if pos == 0 or len(data) < _RENUMBER_BLOCK_SIZE:
+                # Either invalid data or the end of the file, let OggPage
+                # raise the right error for the former.
+                fileobj.seek(offset, 0)
+                try:
+                    OggPage(fileobj)
+                except EOFError:
+                    break
+                fileobj.seek(offset, 0)
+                raise error("unable to renumber page at 0x%x" % offset)
 
     @staticmethod
     def to_packets(pages, strict=False):
@@ -293,6 +459,7 @@ class OggPage(object):
             return cls.from_packets(packets, old_pages[0].sequence)
 
         new_data = b"".join(packets)
+        offset = 0
         new_pages = []
         for old in old_pages:
             new = OggPage()
@@ -301,10 +468,10 @@ class OggPage(object):
             new.continued = old.continued
             new.position = old.position
             for p in old.packets:
-                data, new_data = new_data[:len(p)], new_data[len(p):]
-                new.packets.append(data)
+                new.packets.append(new_data[offset:offset + len(p)])
+                offset += len(p)
             new_pages.append(new)
-        assert not new_data
+        assert offset == len(new_data)
 
         return new_pages
 
@@ -335,20 +502,31 @@ class OggPage(object):
 
         page = OggPage()
         page.sequence = sequence
+        # the size of the page without the last packet
+        page_size = 27
 
         for packet in packets:
+            # Collect the parts of the packet on the current page and only
+            # join them once the page or packet is done.
             page.packets.append(b"")
-            while packet:
-                data, packet = packet[:chunk_size], packet[chunk_size:]
-                if page.size < default_size and len(page.packets) < 255:
-                    page.packets[-1] += data
+            parts = []
+            size = 0
+            offset = 0
+            while offset < len(packet):
+                data = packet[offset:offset + chunk_size]
+                offset += len(data)
+                if page_size + size // 255 + 1 + size < default_size and \
+                        len(page.packets) < 255:
+                    parts.append(data)
+                    size += len(data)
                 else:
                     # If we've put any packet data into this page yet,
                     # we need to mark it incomplete. However, we can
                     # also have just started this packet on an already
                     # full page, in which case, just start the new
                     # page with this packet.
-                    if page.packets[-1]:
+                    if size:
+                        page.packets[-1] = b"".join(parts)
                         page.complete = False
                         if len(page.packets) == 1:
                             page.position = -1
@@ -358,11 +536,18 @@ class OggPage(object):
                     page = OggPage()
                     page.continued = not pages[-1].complete
                     page.sequence = pages[-1].sequence + 1
-                    page.packets.append(data)
+                    page.packets.append(b"")
+                    page_size = 27
+                    parts = [data]
+                    size = len(data)
+
+                if len(packet) - offset < wiggle_room:
+                    parts.append(packet[offset:])
+                    size += len(packet) - offset
+                    offset = len(packet)
 
-                if len(packet) < wiggle_room:
-                    page.packets[-1] += packet
-                    packet = b""
+            page.packets[-1] = b"".join(parts)
+            page_size += size // 255 + 1 + size
 
         if page.packets:
             pages.append(page)
@@ -412,18 +597,17 @@ class OggPage(object):
         elif pages_diff < 0:
             new_data[pages_diff - 1:] = [b"".join(new_data[pages_diff - 1:])]
 
-        # Replace pages one by one. If the sizes match no resize happens.
-        offset_adjust = 0
-        new_data_end = None
+        # Replace all old pages at once, so the rest of the file is only
+        # moved once. Pages of other streams in between (if multiplexed)
+        # are kept as is. If the sizes match no resize happens.
+        plan = EditPlan(fileobj)
         assert len(old_pages) == len(new_data)
+        shift = 0
         for old_page, data in izip(old_pages, new_data):
-            offset = old_page.offset + offset_adjust
-            data_size = len(data)
-            resize_bytes(fileobj, old_page.size, data_size, offset)
-            fileobj.seek(offset, 0)
-            fileobj.write(data)
-            new_data_end = offset + data_size
-            offset_adjust += (data_size - old_page.size)
+            plan.replace(old_page.offset, old_page.size, data)
+            shift += len(data) - old_page.size
+        plan.apply()
+        new_data_end = old_pages[-1].offset + old_pages[-1].size + shift
 
         # Finally, if there's any discrepency in length, we need to
         # renumber the pages for the logical stream.
@@ -433,45 +617,77 @@ class OggPage(object):
             sequence = new_pages[-1].sequence + 1
             cls.renumber(fileobj, serial, sequence)
 
+    @staticmethod
+    def _find_last_backwards(fileobj, serial, block_size=256 * 256):
+        """Search the file backwards block by block for the last page of
+        the stream 'serial' which has a valid CRC.
+
+        Returns a tuple of the page or None and whether a page of the
+        stream with an invalid CRC was skipped.
+        Raises error in case there is no Ogg header at all.
+        Raises IOError.
+        """
+
+        fileobj.seek(0, 2)
+        block_end = fileobj.tell()
+        data = b""
+        invalid = found_sync = False
+        while block_end > 0:
+            block_start = max(block_end - block_size, 0)
+            fileobj.seek(block_start, 0)
+            block = fileobj.read(block_end - block_start)
+            # a page starting in the block ends at the latest in the part
+            # of the following block we keep around
+            data = block + data[:_MAX_PAGE_SIZE]
+
+            # headers starting after the block were checked already
+            index = data.rfind(b"OggS", 0, len(block) + 3)
+            while index != -1:
+                found_sync = True
+                header = data[index:index + 27]
+                if len(header) == 27 and \
+                        cdata.uint_le(header[14:18]) == serial:
+                    try:
+                        page = OggPage.from_buffer(data, index, True)
+                    except error:
+                        invalid = True
+                    else:
+                        page.offset += block_start
+                        return page, invalid
+                index = data.rfind(b"OggS", 0, index)
+
+            block_end = block_start
+
+        if not found_sync:
+            raise error("unable to find final Ogg header")
+
+        return None, invalid
+
     @staticmethod
     def find_last(fileobj, serial):
         """Find the last page of the stream 'serial'.
 
-        If the file is not multiplexed this function is fast. If it is,
-        it must read the whole the stream.
+        The file gets searched backwards starting at the end, so this is
+        fast even for multiplexed files unless the stream ends long before
+        the file does. Only if a page of the stream with an invalid CRC is
+        found on the way and no valid one, the whole stream gets read.
 
-        This finds the last page in the actual file object, or the last
-        page in the stream (with eos set), whichever comes first.
+        This finds the last page in the actual file object, or in the
+        fallback case, the last page in the stream (with eos set),
+        whichever comes first.
 
         Returns None in case no page with the serial exists.
         Raises error in case this isn't a valid ogg stream.
         Raises IOError.
         """
 
-        # For non-muxed streams, look at the last page.
-        seek_end(fileobj, 256 * 256)
+        page, invalid = OggPage._find_last_backwards(fileobj, serial)
+        if page is not None or not invalid:
+            return page
 
-        data = fileobj.read()
-        try:
-            index = data.rindex(b"OggS")
-        except ValueError:
-            raise error("unable to find final Ogg header")
-        bytesobj = cBytesIO(data[index:])
+        # Some muxers write broken pages, so use the slow way and
+        # ignore the CRC.
         best_page = None
-        try:
-            page = OggPage(bytesobj)
-        except error:
-            pass
-        else:
-            if page.serial == serial:
-                if page.last:
-                    return page
-                else:
-                    best_page = page
-            else:
-                best_page = None
-
-        # The stream is muxed, so use the slow way.
         fileobj.seek(0)
         try:
             page = OggPage(fileobj)
@@ -501,7 +717,7 @@ class OggFileType(FileType):
     _Error = None
     _mimes = ["application/ogg", "application/x-ogg"]
 
-    @loadfile()
+    @loadfile(cached=True)
     def load(self, filething):
         """load(filething)
 
@@ -8,7 +8,8 @@ import warnings
 
 from tests import TestCase, DATA_DIR, get_temp_copy
 from mutagen._compat import cBytesIO, text_type, xrange
-from mutagen import File, Metadata, FileType, MutagenError, PaddingInfo
+from mutagen import File, Metadata, FileType, MutagenError, PaddingInfo, \
+    set_io_tracer
 from mutagen._util import loadfile, get_size
 from mutagen.oggvorbis import OggVorbis
 from mutagen.oggflac import OggFLAC
@@ -337,6 +338,60 @@ class TAbstractFileType(object):
                 except MutagenError:
                     pass
 
+    def test_save_rewrite(self):
+        other = get_temp_copy(self.filename)
+        try:
+            self.KIND(other).save()
+            self.audio.save(strategy="rewrite")
+            with open(self.filename, "rb") as h:
+                with open(other, "rb") as o:
+                    self.assertEqual(h.read(), o.read())
+        finally:
+            os.remove(other)
+
+    def test_io_tracer(self):
+        calls = []
+        set_io_tracer(lambda *args: calls.append(args))
+        try:
+            for kind in [self.KIND, File]:
+                audio = kind(self.filename)
+                stats = audio.io_stats
+                self.assertTrue(stats.reads)
+                self.assertEqual(
+                    stats.reads + stats.seeks + stats.writes +
+                    stats.truncates, len(calls))
+                self.assertEqual(stats.read_bytes, sum(
+                    c[3] for c in calls if c[1] == "read"))
+                self.assertTrue(all(c[0] == self.filename for c in calls))
+                del calls[:]
+            audio.save()
+            self.assertEqual(audio.io_stats.seeks, len(
+                [c for c in calls if c[1] == "seek"]))
+            with open(self.filename, "rb") as h:
+                self.assertTrue(self.KIND(h).io_stats.reads)
+        finally:
+            set_io_tracer(None)
+        self.assertEqual(self.KIND(self.filename).io_stats, None)
+
+    def test_io_tracer_reset(self):
+        set_io_tracer(lambda *args: None)
+        try:
+            audio = self.KIND(self.filename)
+        finally:
+            set_io_tracer(None)
+        self.assertTrue(audio.io_stats.reads)
+        audio.save()
+        self.assertEqual(audio.io_stats, None)
+
+        set_io_tracer(lambda *args: None)
+        try:
+            audio.save()
+        finally:
+            set_io_tracer(None)
+        self.assertTrue(audio.io_stats is not None)
+        audio.load(self.filename)
+        self.assertEqual(audio.io_stats, None)
+
     def test_test_fileobj_delete(self):
         with open(self.filename, "rb+") as h:
             o = self.KIND(_TestFileObj(h))
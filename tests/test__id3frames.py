@@ -1137,6 +1137,25 @@ class Tread_frames_load_frame(TestCase):
         self.assertEquals(
             [], read_frames(_22, b'TT1' + b'\x00' * 3, Frames_2_2)[0])
 
+    def test_many_frames_and_padding(self):
+        config = ID3SaveConfig()
+        data = b"".join(
+            save_frame(TXXX(encoding=3, desc=text_type(i), text=u"x"),
+                       config=config)
+            for i in range(500))
+        frames, unknown, remaining = read_frames(
+            _24, data + b"\x00" * 42, Frames)
+        self.assertEqual(len(frames), 500)
+        self.assertEqual(frames[-1].desc, u"499")
+        self.assertEqual(unknown, [])
+        self.assertEqual(remaining, b"\x00" * 42)
+
+    def test_unknown_frame_keeps_header(self):
+        data = b'XYZW\x00\x00\x00\x01\x00\x00a' + b'\x00' * 10
+        frames, unknown, remaining = read_frames(_24, data, Frames)
+        self.assertEqual(unknown, [data[:11]])
+        self.assertEqual(remaining, b'\x00' * 10)
+
     def test_unknown_22_frame(self):
         data = b'XYZ\x00\x00\x01\x00'
         self.assertEquals([data], read_frames(_22, data, {})[1])
@@ -3,7 +3,9 @@
 from mutagen._util import DictMixin, cdata, insert_bytes, delete_bytes, \
     decode_terminated, dict_match, enum, get_size, BitReader, BitReaderError, \
     resize_bytes, seek_end, mmap_move, verify_fileobj, fileobj_name, \
-    read_full, flags, resize_file, fallback_move
+    read_full, flags, resize_file, fallback_move, fallocate_range, \
+    copy_range_move, loadfile, set_save_strategy, MutagenError, _EditFile, \
+    EditPlan, _CachedFileObject, _cache_fileobj
 from mutagen._compat import text_type, itervalues, iterkeys, iteritems, PY2, \
     cBytesIO, xrange, BytesIO
 from tests import TestCase, get_temp_empty
@@ -386,6 +388,65 @@ class MmapMove(TestCase, TMoveMixin):
         self.assertRaises(mmap.error, mmap_move, object(), 0, 0, 0)
 
 
+class Tcopy_range_move(TestCase, TMoveMixin):
+
+    @staticmethod
+    def MOVE(fobj, dest, src, count):
+        if dest < 0 or src < 0 or count < 0:
+            raise ValueError
+        if max(dest, src) + count > get_size(fobj):
+            raise ValueError
+        moved = copy_range_move(fobj, dest, src, count, MIN_STEP=1)
+        if src > dest:
+            dest += moved
+            src += moved
+        fallback_move(fobj, dest, src, count - moved)
+
+    def test_min_step(self):
+        with self.file(b"abc123") as h:
+            self.assertEqual(copy_range_move(h, 0, 1, 4, MIN_STEP=2), 0)
+            self.assertEqual(self.read(h), b"abc123")
+
+    def test_no_fileno(self):
+        self.assertEqual(copy_range_move(cBytesIO(b"abc"), 0, 1, 2, 1), 0)
+
+
+class Tfallocate_range(TestCase):
+
+    def file(self, contents):
+        temp = tempfile.TemporaryFile()
+        temp.write(contents)
+        temp.flush()
+        temp.seek(0)
+        return temp
+
+    def read(self, fobj):
+        fobj.seek(0, 0)
+        return fobj.read()
+
+    def test_insert_collapse(self):
+        block = 4096
+        data = bytes(bytearray(range(256))) * (block // 256) * 3
+        with self.file(data) as h:
+            if not fallocate_range(h, block, block):
+                self.assertEqual(self.read(h), data)
+                return
+            self.assertEqual(
+                self.read(h),
+                data[:block] + b"\x00" * block + data[block:])
+            self.assertTrue(fallocate_range(h, block, block, collapse=True))
+            self.assertEqual(self.read(h), data)
+
+    def test_unaligned(self):
+        with self.file(b"\x00" * 8192) as h:
+            self.assertFalse(fallocate_range(h, 1, 4096))
+            self.assertFalse(fallocate_range(h, 4096, 1))
+            self.assertEqual(self.read(h), b"\x00" * 8192)
+
+    def test_no_fileno(self):
+        self.assertFalse(fallocate_range(cBytesIO(b"\x00" * 8192), 0, 4096))
+
+
 class FileHandling(TestCase):
     def file(self, contents):
         temp = tempfile.TemporaryFile()
@@ -413,6 +474,15 @@ class FileHandling(TestCase):
             resize_bytes(o, 2, 2, 1)
             self.assertEqual(self.read(o), b"abcd")
 
+    def test_insert_delete_aligned(self):
+        data = b"abcdefgh" * 1024
+        with self.file(data) as o:
+            insert_bytes(o, 4096, 4096)
+            self.assertEqual(
+                self.read(o), data[:4096] + b"\x00" * 4096 + data[4096:])
+            delete_bytes(o, 4096, 4096)
+            self.assertEqual(self.read(o), data)
+
     def test_insert_into_empty(self):
         with self.file(b'') as o:
             insert_bytes(o, 8, 0)
@@ -584,6 +654,366 @@ class FileHandlingMockedMMap(FileHandling):
         mmap.mmap = self._orig_mmap
 
 
+class TEditFile(TestCase):
+
+    def _check_starts(self, edit):
+        pos = 0
+        for start, (size, source) in zip(edit._starts, edit._segments):
+            self.assertEqual(start, pos)
+            self.assertTrue(size > 0)
+            pos += size
+        self.assertEqual(len(edit._starts), len(edit._segments))
+        self.assertEqual(pos, edit._size)
+
+    def test_many_writes(self):
+        r = random.Random(42)
+        data = bytearray(os.urandom(10000))
+        offsets = list(range(0, len(data), 3))
+        r.shuffle(offsets)
+        with tempfile.TemporaryFile() as h:
+            h.write(data)
+            edit = _EditFile(h)
+            for offset in offsets:
+                data[offset:offset + 2] = b"ab"
+                edit.seek(offset)
+                edit.write(b"ab")
+            self._check_starts(edit)
+            edit.seek(0)
+            self.assertEqual(edit.read(), bytes(data))
+            edit.seek(5000)
+            self.assertEqual(edit.read(100), bytes(data[5000:5100]))
+
+    def test_random(self):
+        r = random.Random(42)
+        for i in range(50):
+            data = bytes(bytearray(r.randrange(256) for i in range(1000)))
+            ref = BytesIO(data)
+            with tempfile.TemporaryFile() as h:
+                h.write(data)
+                edit = _EditFile(h)
+                for j in range(30):
+                    size = get_size(ref)
+                    op = r.randrange(5)
+                    offset = r.randrange(size + 1)
+                    length = r.randrange(200)
+                    if op == 0:
+                        for f in (ref, edit):
+                            f.seek(offset)
+                        self.assertEqual(edit.read(length), ref.read(length))
+                    elif op == 1:
+                        new = os.urandom(length)
+                        offset += r.randrange(2) * size
+                        for f in (ref, edit):
+                            f.seek(offset)
+                            f.write(new)
+                    elif op == 2:
+                        # the content of the new space is undefined
+                        new = os.urandom(length)
+                        for f in (ref, edit):
+                            insert_bytes(f, length, offset)
+                            f.seek(offset)
+                            f.write(new)
+                    elif op == 3:
+                        length = min(length, size - offset)
+                        for f in (ref, edit):
+                            delete_bytes(f, length, offset)
+                    else:
+                        ref.truncate(offset)
+                        edit.truncate(offset)
+                    if op < 2:
+                        self.assertEqual(ref.tell(), edit.tell())
+                    self.assertEqual(get_size(ref), get_size(edit))
+                    self._check_starts(edit)
+
+                edit.seek(0)
+                self.assertEqual(edit.read(), ref.getvalue())
+                edit._apply()
+                h.seek(0)
+                self.assertEqual(h.read(), ref.getvalue())
+
+
+class TEditPlan(TestCase):
+
+    def _random_edits(self, r, size):
+        edits = []
+        offset = 0
+        while True:
+            offset += r.randrange(1, 300)
+            length = min(r.randrange(3) and r.randrange(200), size - offset)
+            if length < 0:
+                return edits
+            edits.append((offset, length, os.urandom(r.randrange(200))))
+            offset += length
+
+    def test_random(self):
+        r = random.Random(42)
+        for i in range(50):
+            data = os.urandom(r.randrange(3000))
+            edits = self._random_edits(r, len(data))
+            expected = []
+            pos = 0
+            for offset, length, new in edits:
+                expected.extend([data[pos:offset], new])
+                pos = offset + length
+            expected.append(data[pos:])
+            expected = b"".join(expected)
+
+            for f in (BytesIO(), tempfile.TemporaryFile()):
+                f.write(data)
+                plan = EditPlan(f)
+                r.shuffle(edits)
+                for offset, length, new in edits:
+                    plan.replace(offset, length, new)
+                plan.apply()
+                f.seek(0)
+                self.assertEqual(f.read(), expected)
+                f.close()
+
+    def test_edit_file(self):
+        data = os.urandom(1000)
+        with tempfile.TemporaryFile() as h:
+            h.write(data)
+            edit = _EditFile(h)
+            plan = EditPlan(edit)
+            plan.insert(10, b"foo")
+            plan.delete(100, 50)
+            plan.write(500, b"bar")
+            plan.apply()
+            expected = (data[:10] + b"foo" + data[10:100] + data[150:500] +
+                        b"bar" + data[503:])
+            edit.seek(0)
+            self.assertEqual(edit.read(), expected)
+            edit._apply()
+            h.seek(0)
+            self.assertEqual(h.read(), expected)
+
+    def test_resize(self):
+        f = BytesIO(b"abcdefgh")
+        plan = EditPlan(f)
+        plan.resize(1, 2, 4)
+        plan.resize(4, 3, 1)
+        plan.apply()
+        self.assertEqual(f.getvalue(), b"abc\x00\x00deh")
+
+    def test_same_offset(self):
+        f = BytesIO(b"abcd")
+        plan = EditPlan(f)
+        plan.write(2, b"X")
+        plan.insert(2, b"1")
+        plan.insert(2, b"2")
+        plan.insert(4, b"3")
+        plan.apply()
+        self.assertEqual(f.getvalue(), b"ab12Xd3")
+
+    def test_invalid(self):
+        f = BytesIO(b"abcd")
+        plan = EditPlan(f)
+        self.assertRaises(ValueError, plan.delete, -1, 1)
+        self.assertRaises(ValueError, plan.resize, 0, -1, 0)
+        plan.delete(3, 2)
+        self.assertRaises(ValueError, plan.apply)
+        plan.delete(0, 2)
+        plan.write(1, b"x")
+        self.assertRaises(ValueError, plan.apply)
+        self.assertEqual(f.getvalue(), b"abcd")
+
+
+class TCachedFileObject(TestCase):
+
+    def test_random(self):
+        r = random.Random(42)
+        data = os.urandom(200000)
+        ref = BytesIO(data)
+        f = _CachedFileObject(BytesIO(data))
+        for i in range(2000):
+            op = r.randrange(4)
+            if op == 0:
+                offset = r.randrange(-len(data) - 10, 10)
+                try:
+                    ref.seek(offset, 2)
+                except IOError:
+                    self.assertRaises(IOError, f.seek, offset, 2)
+                else:
+                    f.seek(offset, 2)
+            elif op == 1:
+                offset = r.randrange(len(data) + 10)
+                ref.seek(offset)
+                f.seek(offset)
+            elif op == 2:
+                new = os.urandom(r.randrange(100))
+                ref.write(new)
+                f.write(new)
+            else:
+                size = r.choice([-1, r.randrange(100), r.randrange(2 ** 16)])
+                self.assertEqual(f.read(size), ref.read(size))
+            self.assertEqual(f.tell(), ref.tell())
+        f.seek(0)
+        self.assertEqual(f.read(), ref.getvalue())
+
+    def test_cached(self):
+        data = os.urandom(100000)
+
+        class CountingIO(BytesIO):
+            reads = 0
+
+            def read(self, *args):
+                self.reads += 1
+                return BytesIO.read(self, *args)
+
+        fileobj = CountingIO(data)
+        f = _CachedFileObject(fileobj)
+        for i in range(100):
+            f.seek(i * 10)
+            self.assertEqual(f.read(4), data[i * 10:i * 10 + 4])
+            f.seek(-i - 4, 2)
+            self.assertEqual(f.read(2), data[-i - 4:-i - 2])
+        self.assertEqual(fileobj.reads, 2)
+
+    def test_truncate(self):
+        f = _CachedFileObject(BytesIO(b"abcdef"))
+        self.assertEqual(f.read(3), b"abc")
+        f.truncate(2)
+        f.seek(0, 2)
+        self.assertEqual(f.tell(), 2)
+        f.seek(0)
+        self.assertEqual(f.read(), b"ab")
+
+    def test_cache_fileobj(self):
+        fileobj = BytesIO(b"abc")
+        f = _cache_fileobj(fileobj)
+        self.assertTrue(isinstance(f, _CachedFileObject))
+        self.assertTrue(_cache_fileobj(f) is f)
+
+    def test_negative_seek(self):
+        f = _CachedFileObject(BytesIO(b"abc"))
+        self.assertRaises((IOError, ValueError), f.seek, -1)
+        self.assertEqual(f.tell(), 0)
+
+    def test_openfile(self):
+        @loadfile(method=False, cached=True)
+        def check(filething):
+            self.assertTrue(
+                isinstance(filething.fileobj, _CachedFileObject))
+            self.assertEqual(filething.fileobj.read(4), b"abcd")
+
+        @loadfile(method=False)
+        def check_uncached(filething):
+            self.assertFalse(
+                isinstance(filething.fileobj, _CachedFileObject))
+
+        with tempfile.NamedTemporaryFile() as h:
+            h.write(b"abcd")
+            h.flush()
+            check(h.name)
+            check_uncached(h.name)
+
+    def test_block_size(self):
+        f = _cache_fileobj(BytesIO(b"abcdef"), 2)
+        self.assertEqual(f.BLOCK_SIZE, 2)
+        self.assertEqual(_CachedFileObject.BLOCK_SIZE, 2 ** 15)
+        self.assertTrue(_cache_fileobj(f, 2) is f)
+        self.assertTrue(_cache_fileobj(f) is f)
+        g = _cache_fileobj(f, 4)
+        self.assertFalse(g is f)
+        self.assertEqual(g.read(), b"abcdef")
+
+
+@loadfile(method=False, writable=True)
+def _change_file(filething, fail=False):
+    insert_bytes(filething.fileobj, 3, 1)
+    filething.fileobj.seek(1)
+    filething.fileobj.write(b"xyz")
+    if fail:
+        raise MutagenError("fail")
+
+
+class Tsave_strategy(TestCase):
+
+    def setUp(self):
+        self.filename = get_temp_empty()
+        with open(self.filename, "wb") as h:
+            h.write(b"abc")
+
+    def tearDown(self):
+        set_save_strategy("inplace")
+        os.remove(self.filename)
+
+    def read(self):
+        with open(self.filename, "rb") as h:
+            return h.read()
+
+    def test_inplace(self):
+        ino = os.stat(self.filename).st_ino
+        _change_file(self.filename, strategy="inplace")
+        self.assertEqual(self.read(), b"axyzbc")
+        self.assertEqual(os.stat(self.filename).st_ino, ino)
+
+    def test_rewrite(self):
+        os.chmod(self.filename, 0o640)
+        with open(self.filename, "rb") as h:
+            _change_file(self.filename, strategy="rewrite")
+            self.assertEqual(h.read(), b"abc")
+        self.assertEqual(self.read(), b"axyzbc")
+        self.assertEqual(os.stat(self.filename).st_mode & 0o777, 0o640)
+        self.assertEqual(
+            os.listdir(os.path.dirname(self.filename)).count(
+                os.path.basename(self.filename)), 1)
+
+    def test_rewrite_symlink(self):
+        if not hasattr(os, "symlink"):
+            return
+        link = self.filename + ".link"
+        os.symlink(self.filename, link)
+        try:
+            _change_file(link, strategy="rewrite")
+            self.assertTrue(os.path.islink(link))
+        finally:
+            os.remove(link)
+        self.assertEqual(self.read(), b"axyzbc")
+
+    def test_rewrite_large(self):
+        data = os.urandom(3 * 2 ** 20)
+        with open(self.filename, "wb") as h:
+            h.write(data)
+        _change_file(self.filename, strategy="rewrite")
+        self.assertEqual(self.read(), data[:1] + b"xyz" + data[1:])
+
+    def test_rewrite_fail(self):
+        for strategy in ["rewrite", "auto"]:
+            self.assertRaises(MutagenError, _change_file, self.filename,
+                              fail=True, strategy=strategy)
+            self.assertEqual(self.read(), b"abc")
+
+    def test_rewrite_fileobj(self):
+        with open(self.filename, "rb+") as h:
+            _change_file(h, strategy="rewrite")
+        self.assertEqual(self.read(), b"axyzbc")
+
+    def test_global(self):
+        set_save_strategy("rewrite")
+        with open(self.filename, "rb") as h:
+            _change_file(self.filename)
+            self.assertEqual(h.read(), b"abc")
+        self.assertEqual(self.read(), b"axyzbc")
+
+    def test_auto(self):
+        set_save_strategy("auto", threshold=2)
+        with open(self.filename, "rb") as h:
+            _change_file(self.filename)
+            self.assertEqual(h.read(), b"axyzbc")
+
+        set_save_strategy("auto", threshold=1)
+        with open(self.filename, "rb") as h:
+            _change_file(self.filename)
+            self.assertEqual(h.read(), b"axyzbc")
+        self.assertEqual(self.read(), b"axyzxyzbc")
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, set_save_strategy, "foo")
+        self.assertRaises(
+            ValueError, _change_file, self.filename, strategy="foo")
+
+
 class Tdict_match(TestCase):
 
     def test_match(self):
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import copy
+import pickle
+
 from tests import TestCase
 from mutagen._vorbis import VComment, VCommentDict, istag, error
-from mutagen._compat import text_type, PY3
+from mutagen._compat import text_type, PY3, cBytesIO
 
 
 class Tistag(TestCase):
@@ -156,6 +159,23 @@ class TVComment(TestCase):
     def test_roundtrip(self):
         self.assertReallyEqual(self.c, VComment(self.c.write()))
 
+    def test_roundtrip_many(self):
+        for i in range(5000):
+            self.c.append(("key%d" % i, u"\xf6" * (i % 7)))
+        self.assertReallyEqual(self.c, VComment(self.c.write()))
+
+    def test_load_position(self):
+        fileobj = cBytesIO(self.c.write() + b"trailing")
+        comment = VComment()
+        comment.load(fileobj)
+        self.assertEqual(comment, self.c)
+        self.assertEqual(fileobj.read(), b"trailing")
+
+    def test_load_truncated(self):
+        data = self.c.write()
+        for i in range(len(data) - 1):
+            self.assertRaises(error, VComment, data[:i])
+
 
 class TVCommentDict(TestCase):
 
@@ -192,6 +212,48 @@ class TVCommentDict(TestCase):
         self.c["woo"] = "bar"
         self.failUnlessEqual(self.c["woo"], ["bar"])
 
+    def test_index_list_methods(self):
+        self.c.append(("Title", u"a"))
+        self.assertEqual(self.c["title"], [u"more fakes", u"a"])
+        self.c.insert(0, ("title", u"b"))
+        self.assertEqual(self.c["title"], [u"b", u"more fakes", u"a"])
+        self.c.remove(("title", u"more fakes"))
+        self.assertEqual(self.c["title"], [u"b", u"a"])
+        self.c.reverse()
+        self.assertEqual(self.c["title"], [u"a", u"b"])
+        self.c.sort(reverse=True)
+        self.assertEqual(self.c["title"], [u"b", u"a"])
+        self.c.pop(0)
+        self.c.extend([("foo", u"c")])
+        self.c += [("foo", u"d")]
+        self.assertEqual(self.c["foo"], [u"c", u"d"])
+        del self.c[-1:]
+        self.c[-1:] = [("bar", u"e")]
+        self.assertFalse("foo" in self.c)
+        self.assertEqual(self.c["bar"], [u"e"])
+
+    def test_index_del_middle(self):
+        self.c["artist"] = u"x"
+        self.c.append(("Artist", u"y"))
+        self.c.append(("genre", u"z"))
+        self.c["title"] = u"t"
+        self.assertEqual(
+            list(self.c),
+            [("artist", u"x"), ("Artist", u"y"), ("genre", u"z"),
+             ("title", u"t")])
+        del self.c["ARTIST"]
+        self.assertEqual(self.c["genre"], [u"z"])
+        self.assertEqual(self.c["title"], [u"t"])
+        self.assertEqual(sorted(self.c.keys()), ["genre", "title"])
+
+    def test_copy(self):
+        self.assertEqual(self.c["title"], [u"more fakes"])
+        for other in [copy.copy(self.c), copy.deepcopy(self.c),
+                      pickle.loads(pickle.dumps(self.c, 2))]:
+            self.assertEqual(list(other), list(self.c))
+            self.assertEqual(other["artist"], [u"mu", u"piman"])
+            self.assertEqual(other["title"], [u"more fakes"])
+
     def test_slice(self):
         l = [("foo", "bar"), ("foo", "bar2")]
         self.c[:] = l
@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 
+import io
 import os
 import subprocess
 
-from mutagen import MutagenError
+from mutagen import MutagenError, _util
 from mutagen.id3 import ID3, TIT2, ID3NoHeaderError
 from mutagen.flac import to_int_be, Padding, VCFLACDict, MetadataBlock, error
 from mutagen.flac import StreamInfo, SeekTable, CueSheet, FLAC, delete, Picture
@@ -513,6 +514,225 @@ class TFLAC(TestCase):
         f = FLAC(self.NEW)
         self.failUnlessEqual(len(f.pictures), c + 1)
 
+    def test_lazy_picture(self):
+        self.assertFalse(self.flac.pictures[0]._source)
+        flac = FLAC(self.NEW, lazy=True)
+        picture = flac.pictures[0]
+        self.assertTrue(picture._source)
+        self.assertEqual(picture.write()[-150:], picture.data)
+        self.assertFalse(picture._source)
+        self.assertEqual(self.flac.pictures[0], picture)
+
+        with open(self.NEW, "rb") as h:
+            self.assertFalse(FLAC(h, lazy=True).pictures[0]._source)
+
+    def test_lazy_picture_save(self):
+        expected = self.flac.pictures[0].data
+        flac = FLAC(self.NEW, lazy=True)
+        picture = flac.pictures[0]
+        offset = picture._source[1]
+
+        # picture stays where it is
+        flac["title"] = u"SILENCE"
+        flac.save()
+        self.assertEqual(picture._source[1], offset)
+        self.assertEqual(FLAC(self.NEW).pictures[0].data, expected)
+
+        # picture data gets moved
+        flac["title"] = u"foo" * 1000
+        flac.save()
+        self.assertTrue(picture._source[1] > offset)
+        self.assertEqual(FLAC(self.NEW).pictures[0].data, expected)
+        self.assertEqual(picture.data, expected)
+
+    def test_picture_save_unchanged(self):
+        expected = self.flac.pictures[0].data
+        rendered = []
+        write = Picture.write
+
+        def recording_write(picture):
+            rendered.append(picture)
+            return write(picture)
+
+        Picture.write = recording_write
+        try:
+            self.flac["title"] = u"SILENCE"
+            self.flac.save(strategy="inplace")
+            # picture data gets moved
+            self.flac["title"] = u"foo" * 1000
+            self.flac.save(strategy="inplace")
+            self.flac.save(padding=lambda info: 0, strategy="inplace")
+        finally:
+            Picture.write = write
+        self.assertEqual(rendered, [])
+        self.assertEqual(FLAC(self.NEW).pictures[0].data, expected)
+
+        self.flac.pictures[0].data = b"foo"
+        self.flac.save()
+        self.assertEqual(FLAC(self.NEW).pictures[0].data, b"foo")
+
+    def test_picture_save_changed_file(self):
+        expected = self.flac.pictures[0].data
+        other = FLAC(self.NEW)
+        other["title"] = u"x" * 20000
+        other.save()
+        self.flac["artist"] = u"y"
+        self.flac.save()
+        f = FLAC(self.NEW)
+        self.assertEqual(f["artist"], [u"y"])
+        self.assertEqual(f.pictures[0].data, expected)
+
+    def test_lazy_picture_save_rewrite(self):
+        expected = self.flac.pictures[0].data
+        flac = FLAC(self.NEW, lazy=True)
+        flac["title"] = u"foo" * 1000
+        flac.save(strategy="rewrite")
+        self.assertFalse(flac.pictures[0]._source)
+        self.assertEqual(FLAC(self.NEW).pictures[0].data, expected)
+
+    def test_lazy_picture_changed(self):
+        expected = self.flac.pictures[0].data
+        a = FLAC(self.NEW, lazy=True)
+        b = FLAC(self.NEW, lazy=True)
+        b["title"] = u"x" * 20000
+        b.save()
+        a["artist"] = u"y"
+        self.assertRaises(error, a.save)
+        self.assertRaises(error, getattr, a.pictures[0], "data")
+        f = FLAC(self.NEW)
+        self.assertEqual(f["title"], [u"x" * 20000])
+        self.assertEqual(f.pictures[0].data, expected)
+        self.assertEqual(b.pictures[0].data, expected)
+
+    def test_lazy_picture_moved(self):
+        flac = FLAC(self.NEW, lazy=True)
+        os.rename(self.NEW, self.NEW + ".moved")
+        try:
+            self.assertRaises(error, getattr, flac.pictures[0], "data")
+        finally:
+            os.rename(self.NEW + ".moved", self.NEW)
+
+    def test_lazy_picture_truncated(self):
+        with open(self.NEW, "rb+") as h:
+            h.truncate(FLAC(self.NEW, lazy=True).pictures[0]._source[1] + 149)
+        self.assertRaises(error, FLAC, self.NEW, lazy=True)
+
+    def test_save_only_changed(self):
+        writes = []
+
+        class RecordingIO(io.FileIO):
+            def write(self, data):
+                if data:
+                    writes.append(bytes(data))
+                return super(RecordingIO, self).write(data)
+
+        with RecordingIO(self.NEW, "rb+") as h:
+            self.flac.save(h)
+        self.assertEqual(writes, [])
+
+        self.flac["title"] = u"SILENCE"
+        with RecordingIO(self.NEW, "rb+") as h:
+            self.flac.save(h)
+        self.assertEqual(
+            writes, [bytes(MetadataBlock._writeblock(self.flac.tags))])
+        self.assertEqual(FLAC(self.NEW)["title"], [u"SILENCE"])
+
+    def test_save_audio_offset(self):
+        self.flac["title"] = u"foo" * 1000
+        self.flac.save()
+        self.assertEqual(self.flac._audio_offset[3],
+                         FLAC(self.NEW)._audio_offset[3])
+
+        # the file changed in between, so the old offset isn't used
+        other = FLAC(self.NEW)
+        other["title"] = u"bar" * 2000
+        other.save()
+        self.flac["title"] = u"foo"
+        self.flac.save()
+        f = FLAC(self.NEW)
+        self.assertEqual(f["title"], [u"foo"])
+        self.assertEqual(f.info.length, self.flac.info.length)
+
+    def test_save_audio_offset_same_size(self):
+        with open(self.NEW, "ab") as h:
+            h.write(b"TAG" + b"\x00" * 125)
+        size = os.path.getsize(self.NEW)
+        with open(self.NEW, "rb") as h:
+            h.seek(self.flac._audio_offset[3])
+            audio = h.read()[:-128]
+        self.flac = FLAC(self.NEW)
+
+        # the audio moves back by the size of the removed ID3v1 tag
+        other = FLAC(self.NEW)
+        other.save(deleteid3=True, padding=lambda info: info.padding + 128)
+        self.assertEqual(os.path.getsize(self.NEW), size)
+        # make the old offset look like the audio start
+        with open(self.NEW, "rb+") as h:
+            h.seek(self.flac._audio_offset[3])
+            h.write(b"\xff\xf8")
+
+        self.flac["title"] = u"foo"
+        self.flac.save()
+        f = FLAC(self.NEW)
+        self.assertEqual(f["title"], [u"foo"])
+        with open(self.NEW, "rb") as h:
+            h.seek(f._audio_offset[3])
+            self.assertEqual(h.read(), audio)
+
+    def test_build_seektable(self):
+        old = self.flac.seektable
+        table = self.flac.build_seektable(interval_seconds=1)
+        self.assertTrue(table is old)
+        # same as created by the flac encoder, minus the placeholder
+        self.assertEqual(
+            table.seekpoints,
+            [(0, 0, 4608), (41472, 11852, 4608), (87552, 25022, 4608),
+             (129024, 36867, 4608)])
+
+        size = os.path.getsize(self.NEW)
+        self.flac.save()
+        self.assertEqual(os.path.getsize(self.NEW), size)
+        self.assertEqual(FLAC(self.NEW).seektable, table)
+
+    def test_build_seektable_all_frames(self):
+        table = self.flac.build_seektable(interval_seconds=0.001)
+        self.assertEqual(len(table.seekpoints), 36)
+        with open(self.NEW, "rb") as h:
+            h.seek(self.flac._audio_offset[3])
+            data = h.read()
+        self.assertEqual(sum(p.num_samples for p in table.seekpoints),
+                         self.flac.info.total_samples)
+        for point in table.seekpoints:
+            self.assertEqual(data[point.byte_offset:][:2], b"\xff\xf8")
+
+    def test_build_seektable_variable(self):
+        filename = get_temp_copy(os.path.join(DATA_DIR, "variable-block.flac"))
+        try:
+            f = FLAC(filename)
+            points = f.build_seektable(interval_seconds=0.01).seekpoints
+        finally:
+            os.unlink(filename)
+        self.assertEqual(len(points), 11)
+        self.assertEqual(points[:3],
+                         [(0, 0, 8192), (8192, 14, 8192), (16384, 30, 8192)])
+        for a, b in zip(points, points[1:]):
+            self.assertEqual(a.first_sample + a.num_samples, b.first_sample)
+
+    def test_build_seektable_readonly(self):
+        with open(self.NEW, "rb") as h:
+            table = self.flac.build_seektable(h, interval_seconds=1)
+        self.assertEqual(len(table.seekpoints), 4)
+        self.assertEqual(self.flac.filename, self.NEW)
+
+    def test_build_seektable_new(self):
+        self.flac.metadata_blocks.remove(self.flac.seektable)
+        self.flac.seektable = None
+        table = self.flac.build_seektable()
+        self.assertEqual(table.seekpoints, [(0, 0, 4608)])
+        self.assertTrue(self.flac.metadata_blocks[-2] is table)
+        self.assertTrue(isinstance(self.flac.metadata_blocks[-1], Padding))
+        self.assertRaises(ValueError, self.flac.build_seektable, self.NEW, 0)
+
     def test_clear_pictures(self):
         f = FLAC(self.NEW)
         c1 = len(f.pictures)
@@ -558,6 +778,43 @@ class TFLAC(TestCase):
     def test_load_flac_with_application_block(self):
         FLAC(os.path.join(DATA_DIR, "flac_application.flac"))
 
+    def test_prefetch_size(self):
+        reads = []
+
+        class CountingIO(io.BytesIO):
+            def read(self, *args):
+                reads.append(args)
+                return super(CountingIO, self).read(*args)
+
+        class SmallFLAC(FLAC):
+            PREFETCH_SIZE = 64
+
+        with open(self.NEW, "rb") as h:
+            data = h.read()
+        FLAC(CountingIO(data))
+        count = len(reads)
+        del reads[:]
+        SmallFLAC(CountingIO(data))
+        self.assertTrue(len(reads) > count)
+
+    def test_cached_once(self):
+        wrapped = []
+        init = _util._CachedFileObject.__init__
+
+        def counting_init(self, fileobj, *args):
+            wrapped.append(fileobj)
+            init(self, fileobj, *args)
+
+        _util._CachedFileObject.__init__ = counting_init
+        try:
+            FLAC(self.NEW)
+            self.assertEqual(len(wrapped), 1)
+            with open(self.NEW, "rb") as h:
+                FLAC(h)
+            self.assertEqual(len(wrapped), 2)
+        finally:
+            _util._CachedFileObject.__init__ = init
+
 
 class TFLACFile(TestCase):
 
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 import os
+import random
+import struct
 
 from mutagen import id3
 from mutagen import MutagenError
@@ -8,7 +10,8 @@ from mutagen.apev2 import APEv2
 from mutagen.id3 import ID3, Frames, ID3UnsupportedVersionError, TIT2, \
     CHAP, CTOC, TT1, TCON, COMM, TORY, PIC, MakeID3v1, TRCK, TYER, TDRC, \
     TDAT, TIME, LNK, IPLS, TPE1, BinaryFrame, TIT3, POPM, APIC, CRM, \
-    TALB, TPE2, TSOT, TDEN, TIPL, ParseID3v1, Encoding, ID3Tags, RVAD
+    TALB, TPE2, TSOT, TDEN, TIPL, ParseID3v1, Encoding, ID3Tags, RVAD, \
+    TXXX, Frame
 from mutagen.id3._util import BitPaddedInt, error as ID3Error
 from mutagen.id3._tags import determine_bpi, ID3Header, \
     save_frame, ID3SaveConfig
@@ -921,6 +924,162 @@ class TID3Write(TestCase):
         assert data.find(b"TYER") < data.find(b"APIC")
 
 
+class TID3Lazy(TestCase):
+
+    def setUp(self):
+        self.filename = get_temp_copy(
+            os.path.join(DATA_DIR, 'silence-44-s.mp3'))
+        tag = ID3(self.filename)
+        tag.add(APIC(encoding=0, mime=u"image/png", type=3, desc=u"a",
+                     data=b"\x01" * 3000))
+        tag.add(TXXX(encoding=3, desc=u"foo", text=[u"bar"]))
+        tag.save()
+
+    def tearDown(self):
+        os.unlink(self.filename)
+
+    def _record_decoding(self):
+        """Returns a list which gets the IDs of all decoded frames"""
+
+        decoded = []
+        from_data = Frame.__dict__["_fromData"]
+        func = Frame._fromData.__func__
+
+        def recording_from_data(cls, header, tflags, data):
+            decoded.append(cls.__name__)
+            return func(cls, header, tflags, data)
+
+        Frame._fromData = classmethod(recording_from_data)
+        self.addCleanup(setattr, Frame, "_fromData", from_data)
+        return decoded
+
+    def _write_tag(self, frames):
+        data = b"".join(
+            name + BitPaddedInt.to_str(len(d)) + b"\x00\x00" + d
+            for name, d in frames)
+        with open(self.filename, "wb") as h:
+            h.write(b"ID3\x04\x00\x00" + BitPaddedInt.to_str(len(data)) +
+                    data)
+
+    def _save(self, frames, **kwargs):
+        """Writes a tag with the raw frames, loads and saves it again and
+        returns the resulting file content.
+        """
+
+        self._write_tag(frames)
+        ID3(self.filename, **kwargs).save()
+        with open(self.filename, "rb") as h:
+            return h.read()
+
+    def test_same_as_eager(self):
+        eager = ID3(self.filename)
+        lazy = ID3(self.filename, lazy=True)
+        self.assertEqual(sorted(eager.keys()), sorted(lazy.keys()))
+        for key in eager.keys():
+            self.assertEqual(eager[key], lazy[key])
+
+    def test_decode_on_access(self):
+        decoded = self._record_decoding()
+        tag = ID3(self.filename, lazy=True)
+        self.assertEqual(tag.getall("TXXX")[0].text, [u"bar"])
+        self.assertTrue("TXXX" in decoded)
+        self.assertTrue("TIT2" in tag)
+        self.assertTrue("TIT2" in decoded)
+        self.assertFalse("APIC" in decoded)
+        self.assertEqual(tag.getall("APIC")[0].data, b"\x01" * 3000)
+        self.assertTrue("APIC" in decoded)
+
+    def test_save_untouched(self):
+        with open(self.filename, "rb") as h:
+            orig = h.read()
+        decoded = self._record_decoding()
+        tag = ID3(self.filename, lazy=True)
+        tag.save(padding=lambda info: info.padding)
+        self.assertFalse("APIC" in decoded)
+        with open(self.filename, "rb") as h:
+            self.assertEqual(h.read(), orig)
+
+    def test_save_changed(self):
+        decoded = self._record_decoding()
+        tag = ID3(self.filename, lazy=True)
+        tag.delall("TXXX")
+        tag.add(TIT2(encoding=3, text=[u"new"]))
+        tag.save()
+        self.assertFalse("APIC" in decoded)
+        tag = ID3(self.filename)
+        self.assertEqual(tag.getall("TXXX"), [])
+        self.assertEqual(tag["TIT2"].text, [u"new"])
+        self.assertEqual(tag.getall("APIC")[0].data, b"\x01" * 3000)
+
+    def test_save_other_version(self):
+        tag = ID3(self.filename, lazy=True, v2_version=3)
+        tag.save(v2_version=3)
+        tag = ID3(self.filename)
+        self.assertEqual(tag.version, (2, 3, 0))
+        self.assertEqual(tag.getall("APIC")[0].data, b"\x01" * 3000)
+        self.assertEqual(tag.getall("TXXX")[0].text, [u"bar"])
+
+    def test_apic_mime(self):
+        apic = b"\x00PNG\x00\x03a\x00" + b"\x01" * 3000
+        self._write_tag([(b"APIC", apic)])
+        tag = ID3(self.filename, lazy=True)
+        self.assertEqual(tag.getall("APIC")[0].mime, u"image/png")
+
+        self.assertEqual(self._save([(b"APIC", apic)], lazy=True),
+                         self._save([(b"APIC", apic)]))
+        tag = ID3(self.filename, translate=False)
+        self.assertEqual(tag.getall("APIC")[0].mime, u"image/png")
+
+    def test_duplicates(self):
+        frames = [(b"TIT2", b"\x00a"), (b"TIT2", b"\x00b"),
+                  (b"TXXX", b"\x00foo\x00bar"), (b"TXXX", b"\x00foo\x00baz")]
+        self.assertEqual(self._save(frames, lazy=True), self._save(frames))
+        tag = ID3(self.filename)
+        self.assertEqual(tag["TIT2"].text, [u"a", u"b"])
+        self.assertEqual(len(tag.getall("TXXX")), 1)
+
+
+class TID3Only(TestCase):
+
+    def setUp(self):
+        self.filename = get_temp_copy(
+            os.path.join(DATA_DIR, 'silence-44-s.mp3'))
+        tag = ID3(self.filename)
+        tag.add(APIC(encoding=0, mime=u"image/png", type=3, desc=u"a",
+                     data=b"\x01" * 3000))
+        tag.save()
+
+    def tearDown(self):
+        os.unlink(self.filename)
+
+    def test_skip(self):
+        full = ID3(self.filename)
+        tag = ID3(self.filename, frames=["TIT2", "TPE1"])
+        self.assertEqual(sorted(tag.keys()), ["TIT2", "TPE1"])
+        self.assertEqual(tag["TIT2"], full["TIT2"])
+        self.assertEqual(tag["TPE1"], full["TPE1"])
+        self.assertEqual(tag._padding, full._padding)
+
+    def test_v23_unsynch(self):
+        tag = ID3(os.path.join(DATA_DIR, 'id3v23_unsynch.id3'),
+                  frames=["TPE1"])
+        self.assertEqual(list(tag.keys()), ["TPE1"])
+        self.assertEqual(tag["TPE1"], [u"Nina Simone"])
+
+    def test_int_sizes_fallback(self):
+        size = BitPaddedInt.to_str(1000, bits=8)
+        data = b"TPE2" + size + b"\x00\x00" + b"\x00a" + b"b" * 998
+        data += b"TIT2\x00\x00\x00\x02\x00\x00\x00c"
+        tag = b"ID3\x04\x00\x00" + BitPaddedInt.to_str(len(data)) + data
+        id3 = ID3(cBytesIO(tag), frames=["TIT2"])
+        self.assertEqual(list(id3.keys()), ["TIT2"])
+        self.assertEqual(id3["TIT2"], [u"c"])
+
+    def test_no_save(self):
+        tag = ID3(self.filename, frames=["TIT2"])
+        self.assertRaises(ID3Error, tag.save)
+
+
 class WriteForEyeD3(TestCase):
 
     def setUp(self):
@@ -1086,6 +1245,82 @@ class TID3Misc(TestCase):
             b"\x01" * 875
         self.assertTrue(determine_bpi(d, Frames) is BitPaddedInt)
 
+        # stops early but gives the same result as a full walk
+        d = get_frame_data(b"TPE2", 1000, False) + \
+            get_frame_data(b"TPE1", 10, False) * 3
+        self.assertTrue(determine_bpi(d, Frames) is int)
+        self.assertTrue(determine_bpi(d + b"\x00" * 20, Frames) is int)
+
+        # small frames are the same for both, the bigger one decides
+        d = get_frame_data(b"TPE1", 10) * 3 + get_frame_data(b"TPE2", 1000)
+        self.assertTrue(determine_bpi(d, Frames) is BitPaddedInt)
+        d = get_frame_data(b"TPE1", 10) * 3 + \
+            get_frame_data(b"TPE2", 1000, False)
+        self.assertTrue(determine_bpi(d, Frames) is int)
+
+    def test_determine_bpi_random(self):
+        def walk(data, bpi):
+            o = found = 0
+            while o < len(data) - 10:
+                part = data[o:o + 10]
+                if part == b"\x00" * 10:
+                    return found, -((len(data) - o) % 10)
+                name, size, flags = struct.unpack('>4sLH', part)
+                o += 10 + bpi(size)
+                found += name.decode("latin-1") in Frames
+            return found, o - len(data)
+
+        r = random.Random(42)
+        for i in xrange(500):
+            data = b""
+            for j in xrange(r.randrange(6)):
+                size = r.choice([r.randrange(0x80), r.randrange(0x400)])
+                if r.randrange(2):
+                    size = BitPaddedInt.to_str(size)
+                else:
+                    size = BitPaddedInt.to_str(size, bits=8)
+                data += r.choice([b"TPE1", b"TPE2", b"XXXX"]) + size + \
+                    b"\x00\x00" + b"\x01" * r.randrange(0x200)
+            data += b"\x00" * r.randrange(20)
+            asbpi, bpioff = walk(data, BitPaddedInt)
+            asint, intoff = walk(data, int)
+            if asint > asbpi or (
+                    asint == asbpi and (bpioff >= 1 and intoff <= 1)):
+                expected = int
+            else:
+                expected = BitPaddedInt
+            self.assertTrue(determine_bpi(data, Frames) is expected)
+
+    def test_bpi_chap_subframes(self):
+        # CHAP/CTOC subframes use the frame size type of the whole tag
+        # instead of determining it from their own data
+        sub = b"\x00" + b"a" * 127 + b"TPE1\x00\x00\x00\x05\x00\x00" + \
+            b"\x00abcd" + b"x" * 113
+        self.assertEqual(len(sub), 256)
+        sub = b"TIT2" + BitPaddedInt.to_str(256, bits=8) + b"\x00\x00" + sub
+        self.assertTrue(determine_bpi(sub, Frames) is BitPaddedInt)
+
+        chap = b"ch\x00" + b"\x00" * 16 + sub
+        size = BitPaddedInt.to_str(1000, bits=8)
+        data = b"TPE2" + size + b"\x00\x00" + b"\x00a" + b"b" * 998
+        data += b"CHAP" + BitPaddedInt.to_str(len(chap), bits=8) + \
+            b"\x00\x00" + chap
+        tag = b"ID3\x04\x00\x00" + BitPaddedInt.to_str(len(data)) + data
+        id3 = ID3(cBytesIO(tag))
+        self.assertTrue(id3._header._bpi is int)
+        chap = id3.getall("CHAP")[0]
+        self.assertEqual(list(chap.sub_frames.keys()), ["TIT2"])
+        self.assertEqual(
+            chap.sub_frames["TIT2"].text[0], u"a" * 127 + u"TPE1")
+
+    def test_bpi_kept_on_header(self):
+        size = BitPaddedInt.to_str(1000, bits=8)
+        data = b"TPE2" + size + b"\x00\x00" + b"\x00a" + b"b" * 998
+        tag = b"ID3\x04\x00\x00" + BitPaddedInt.to_str(len(data)) + data
+        id3 = ID3(cBytesIO(tag))
+        self.assertTrue(id3._header._bpi is int)
+        self.assertEqual(id3["TPE2"].text, [u"a" + u"b" * 998])
+
 
 try:
     import eyeD3
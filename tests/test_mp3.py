@@ -5,7 +5,9 @@ import os
 from tests import TestCase, DATA_DIR, get_temp_copy
 from mutagen._compat import cBytesIO, text_type, xrange
 from mutagen.mp3 import MP3, error as MP3Error, delete, MPEGInfo, EasyMP3, \
-    BitrateMode, iter_sync
+    BitrateMode, iter_sync, MPEGFrame, HeaderNotFoundError
+from mutagen.mp3 import _iter_sync_data
+from mutagen import mp3
 from mutagen.mp3._util import XingHeader, XingHeaderError, VBRIHeader, \
     VBRIHeaderError, LAMEHeader, LAMEError
 from mutagen.id3 import ID3
@@ -34,6 +36,29 @@ class TMP3Util(TestCase):
             fileobj = cBytesIO(b"\x00" * i + b"\xff\xe0")
             self.assertEqual(get_syncs(fileobj, 100 + i), [i])
 
+    def test_sync_data_blocks(self):
+        data = b"\x00" * 15 + b"\xff\xe0" + b"\x00" * 10 + b"\xff\xe1"
+        for lookahead in [0, 3, 10]:
+            res = []
+            for buf, index, offset in _iter_sync_data(
+                    cBytesIO(data), 100, lookahead, block_size=16):
+                self.assertEqual(buf[index:index + 2], data[offset:offset + 2])
+                self.assertTrue(
+                    len(buf) - index - 2 >= min(lookahead, 27 - offset))
+                res.append(offset)
+            self.assertEqual(res, [15, 27])
+
+    def test_junk_prefix(self):
+        with open(os.path.join(DATA_DIR, "silence-44-s.mp3"), "rb") as h:
+            data = h.read()
+        info = MPEGInfo(cBytesIO(data))
+        # valid headers, but not followed by another frame
+        junk = (b"\xff\xfb\x92\x44" + b"\x00" * 10) * 500
+        junk_info = MPEGInfo(cBytesIO(junk + data))
+        self.assertEqual(junk_info.bitrate, info.bitrate)
+        self.assertEqual(junk_info.sample_rate, info.sample_rate)
+        self.assertTrue(junk_info.frame_offset > len(junk))
+
 
 class TMP3(TestCase):
     silence = os.path.join(DATA_DIR, 'silence-44-s.mp3')
@@ -234,6 +259,138 @@ class TMPEGInfo(TestCase):
         self.failUnlessRaises(MP3Error, MPEGInfo, fileobj)
 
 
+class TMPEGInfoAccurate(TestCase):
+
+    def test_cbr(self):
+        info = MP3(os.path.join(DATA_DIR, "silence-44-s.mp3"),
+                   accurate_length=True).info
+        self.assertEqual(info.total_frames, 143)
+        self.assertEqual(info.total_samples, 143 * 1152)
+        self.assertAlmostEqual(info.length, 143 * 1152 / 44100.0)
+        self.assertEqual(info.bitrate_mode, BitrateMode.CBR)
+        self.assertEqual(len(info._frame_offsets), 143)
+        self.assertEqual(info._frame_offsets[0], info.frame_offset)
+
+    def test_not_accurate(self):
+        info = MP3(os.path.join(DATA_DIR, "silence-44-s.mp3")).info
+        self.assertTrue(info.total_frames is None)
+        self.assertTrue(info.total_samples is None)
+
+    def test_xing_lame(self):
+        filename = os.path.join(DATA_DIR, "lame.mp3")
+        info = MP3(filename).info
+        accurate = MP3(filename, accurate_length=True).info
+        # the frame with the Xing header doesn't count
+        self.assertEqual(accurate.total_frames, 4)
+        self.assertEqual(accurate.length, info.length)
+
+    def test_junk_between_frames(self):
+        with open(os.path.join(DATA_DIR, "silence-44-s-v1.mp3"), "rb") as h:
+            data = h.read()
+        info = MPEGInfo(cBytesIO(data), accurate_length=True)
+        offset = info._frame_offsets[50]
+        data = data[:offset] + b"\x00\xff" * 100 + data[offset:]
+        junk_info = MPEGInfo(cBytesIO(data), accurate_length=True)
+        self.assertEqual(junk_info.total_frames, info.total_frames)
+        self.assertEqual(junk_info._frame_offsets[50], offset + 200)
+
+
+class TMPEGSeekIndex(TestCase):
+
+    def test_cbr(self):
+        filename = os.path.join(DATA_DIR, "silence-44-s.mp3")
+        info = MP3(filename).info
+        self.assertEqual(info.bitrate_mode, BitrateMode.UNKNOWN)
+        index = info.seek_index()
+        self.assertFalse(index.exact)
+        self.assertEqual(len(index), 100)
+        self.assertAlmostEqual(index.interval, info.length / 100)
+        self.assertEqual(index.get_offset(0), info.frame_offset)
+        size = os.path.getsize(filename) - info.frame_offset
+        self.assertEqual(index.get_offset(info.length / 2),
+                         info.frame_offset + size // 2)
+        self.assertEqual(index.get_offset(info.length / 4),
+                         info.frame_offset + size // 4)
+        self.assertTrue(index.get_offset(info.length * 2) <
+                        info.frame_offset + size)
+
+    def test_frame_walk(self):
+        info = MP3(os.path.join(DATA_DIR, "silence-44-s.mp3"),
+                   accurate_length=True).info
+        index = info.seek_index()
+        self.assertTrue(index.exact)
+        self.assertEqual(len(index), info.total_frames)
+        self.assertAlmostEqual(index.interval, 1152 / 44100.0)
+        self.assertEqual(index.get_offset(0), info.frame_offset)
+        self.assertEqual(index.get_offset(-1), info.frame_offset)
+        self.assertEqual(
+            index.get_offset(index.interval * 10.5), info._frame_offsets[10])
+        self.assertEqual(
+            index.get_offset(info.length * 2), info._frame_offsets[-1])
+
+    def test_xing_toc(self):
+        info = MP3(os.path.join(DATA_DIR, "bad-POPM-frame.mp3")).info
+        index = info.seek_index()
+        self.assertFalse(index.exact)
+        self.assertEqual(len(index), 100)
+        self.assertAlmostEqual(index.interval, info.length / 100)
+        self.assertEqual(index.get_offset(0), info.frame_offset)
+        offsets = [index.get_offset(info.length * i / 20.0)
+                   for i in range(21)]
+        self.assertEqual(offsets, sorted(offsets))
+        self.assertTrue(offsets[-1] < info.frame_offset + 3015142)
+
+    def test_vbri_toc(self):
+        info = MP3(os.path.join(DATA_DIR, "vbri.mp3")).info
+        index = info.seek_index()
+        self.assertFalse(index.exact)
+        self.assertEqual(len(index), 132)
+        self.assertAlmostEqual(index.interval, 64 * 1152 / 44100.0)
+        self.assertEqual(index.get_offset(0), info.frame_offset)
+        middle = index.get_offset(index.interval * 1.5)
+        self.assertTrue(index.offsets[1] < middle < index.offsets[2])
+
+    def test_large_offsets(self):
+        offsets = mp3._offset_array([2 ** 40, 2 ** 40 + 1])
+        offsets.append(2 ** 40 + 2)
+        self.assertEqual(list(offsets), [2 ** 40, 2 ** 40 + 1, 2 ** 40 + 2])
+
+    def test_no_array_type(self):
+        offset_type = mp3._OFFSET_TYPE
+        mp3._OFFSET_TYPE = None
+        try:
+            info = MP3(os.path.join(DATA_DIR, "silence-44-s.mp3"),
+                       accurate_length=True).info
+            self.assertTrue(isinstance(info.seek_index().offsets, list))
+            self.assertEqual(
+                info.seek_index().get_offset(0), info.frame_offset)
+        finally:
+            mp3._OFFSET_TYPE = offset_type
+
+
+class TMPEGFrame(TestCase):
+
+    def test_header(self):
+        # MPEG 1 layer 3, 128 kbps, 44100 Hz, padding, joint stereo
+        frame = MPEGFrame(cBytesIO(b"\xff\xfb\x92\x44" + b"\x00" * 500))
+        self.assertEqual(frame.version, 1)
+        self.assertEqual(frame.layer, 3)
+        self.assertEqual(frame.bitrate, 128000)
+        self.assertEqual(frame.sample_rate, 44100)
+        self.assertTrue(frame.padding)
+        self.assertFalse(frame.protected)
+        self.assertEqual(frame.mode, 1)
+        self.assertEqual(frame.channels, 2)
+
+    def test_invalid(self):
+        for data in [b"", b"\xff\xfb\x92", b"\xff\x1b\x92\x44",
+                     b"\xff\xfb\xf2\x44", b"\xff\xfb\x02\x44",
+                     b"\xff\xfb\x9e\x44", b"\xff\xeb\x92\x44",
+                     b"\xff\xf9\x92\x44"]:
+            self.assertRaises(
+                HeaderNotFoundError, MPEGFrame, cBytesIO(data))
+
+
 class TEasyMP3(TestCase):
 
     def setUp(self):
@@ -3,12 +3,14 @@
 import os
 import struct
 import subprocess
+from array import array
 
 from mutagen._compat import cBytesIO, PY3, text_type, PY2, izip
 from tests import TestCase, DATA_DIR, get_temp_copy
 from mutagen.mp4 import (MP4, Atom, Atoms, MP4Tags, MP4Info, delete, MP4Cover,
                          MP4MetadataError, MP4FreeForm, error, AtomDataType,
                          AtomError, _item_sort_key, MP4StreamInfoError)
+from mutagen import mp4
 from mutagen.mp4._util import parse_full_atom
 from mutagen.mp4._as_entry import AudioSampleEntry, ASEntryError
 from mutagen._util import cdata
@@ -123,6 +125,31 @@ class TAtoms(TestCase):
     def test_repr(self):
         repr(self.atoms)
 
+    def test_lazy_containers(self):
+        tfhd = Atom.render(b"tfhd", b"\x00" * 8)
+        data = cBytesIO(
+            Atom.render(b"ftyp", b"M4A ") +
+            Atom.render(b"moov", Atom.render(b"udta", b"")) +
+            Atom.render(b"moof", Atom.render(b"traf", tfhd)) +
+            Atom.render(b"mdat", b"\x00" * 10))
+        atoms = Atoms(data)
+        moov, moof = atoms.atoms[1:3]
+        # moov is parsed right away, moof on first access
+        self.assertEqual(len(moov._children), 1)
+        self.assertTrue(moof._children is None)
+        repr(atoms)
+        self.assertTrue(moof._children is None)
+        self.assertEqual(
+            [a.name for a in moof.findall(b"tfhd", True)], [b"tfhd"])
+        self.assertEqual(atoms[b"moof.traf.tfhd"].offset, 44)
+
+    def test_lazy_error(self):
+        data = cBytesIO(
+            Atom.render(b"moov", b"") +
+            Atom.render(b"moof", b"\x00\x00\x00\x02" + b"\x00" * 10))
+        atoms = Atoms(data)
+        self.assertRaises(AtomError, lambda: atoms[b"moof"].children)
+
 
 class TMP4Info(TestCase):
 
@@ -869,6 +896,66 @@ class TMP4NoTags3G2(TMP4, TMP4Mixin):
         self.failUnlessAlmostEqual(15, self.audio.info.length, 1)
 
 
+class TMP4UpdateOffsetTable(TestCase):
+
+    def _update(self, size, offsets, delta, offset):
+        fmt = ">%d" + {4: "I", 8: "Q"}[size]
+        name = {4: b"stco", 8: b"co64"}[size]
+        fileobj = cBytesIO()
+        fileobj.write(Atom.render(
+            name, b"\x00" * 4 + struct.pack(">I", len(offsets)) +
+            struct.pack(fmt % len(offsets), *offsets)))
+        fileobj.seek(0)
+        atom = Atom(fileobj)
+        MP4Tags()._MP4Tags__update_offset_table(
+            fileobj, size, atom, delta, offset)
+        data = fileobj.getvalue()
+        self.assertEqual(len(data), 16 + size * len(offsets))
+        return list(struct.unpack(fmt % len(offsets), data[16:]))
+
+    def _check(self, size):
+        offsets = [10, 200, 50, 300, 400, 20]
+        self.assertEqual(self._update(size, offsets, 5, 100),
+                         [10, 205, 50, 305, 405, 20])
+        self.assertEqual(self._update(size, offsets, -5, 0),
+                         [5, 195, 45, 295, 395, 15])
+        self.assertEqual(self._update(size, offsets, 5, 1000), offsets)
+
+    def test_stco(self):
+        self._check(4)
+
+    def test_co64(self):
+        self._check(8)
+        big = [2 ** 40, 2 ** 41]
+        self.assertEqual(
+            self._update(8, big, 1, 0), [2 ** 40 + 1, 2 ** 41 + 1])
+
+    def test_chunks(self):
+        chunk_entries = mp4._OFFSET_CHUNK_ENTRIES
+        mp4._OFFSET_CHUNK_ENTRIES = 4
+        try:
+            self._check(4)
+            self._check(8)
+        finally:
+            mp4._OFFSET_CHUNK_ENTRIES = chunk_entries
+
+    def test_no_array_type(self):
+        get_array_type = mp4._get_array_type
+        mp4._get_array_type = lambda size: None
+        try:
+            self._check(4)
+            self._check(8)
+        finally:
+            mp4._get_array_type = get_array_type
+
+    def test_get_array_type(self):
+        for size in [4, 8]:
+            code = mp4._get_array_type(size)
+            if code is not None:
+                self.assertEqual(array(code).itemsize, size)
+        self.assertEqual(mp4._get_array_type(3), None)
+
+
 class TMP4UpdateParents64Bit(TestCase):
     original = os.path.join(DATA_DIR, "64bit.mp4")
 
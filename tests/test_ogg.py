@@ -9,6 +9,7 @@ from tests import TestCase, DATA_DIR, get_temp_copy
 from mutagen.ogg import OggPage, error as OggError
 from mutagen._util import cdata
 from mutagen import _util
+from mutagen import ogg
 
 
 class TOggPage(TestCase):
@@ -261,6 +262,127 @@ class TOggPage(TestCase):
         self.failUnlessEqual(
             [page.sequence for page in pages], list(xrange(20, 29)))
 
+    def test_from_buffer(self):
+        data = b"".join(page.write() for page in self.pages)
+        offset = 0
+        for page in self.pages:
+            new = OggPage.from_buffer(data, offset, check_crc=True)
+            self.assertEqual(new, page)
+            self.assertEqual(new.offset, offset)
+            self.assertEqual(new, OggPage(BytesIO(data[offset:])))
+            offset += page.size
+        self.assertRaises(EOFError, OggPage.from_buffer, data, offset)
+        self.assertRaises(
+            OggError, OggPage.from_buffer, data[:self.pages[0].size - 1])
+        self.assertRaises(OggError, OggPage.from_buffer, data, 1)
+        self.assertEqual(
+            OggPage.from_buffer(bytearray(data), self.pages[0].size),
+            self.pages[1])
+
+    def test_from_buffer_crc(self):
+        data = bytearray(self.pages[0].write())
+        data[-1] ^= 0xff
+        data = bytes(data)
+        self.assertTrue(OggPage.from_buffer(data))
+        self.assertRaises(
+            OggError, OggPage.from_buffer, data, check_crc=True)
+
+    def test_iter_pages(self):
+        pages = OggPage.from_packets(
+            [b"x" * 100000, b"y" * 500, b"z" * 3000], default_size=1000)
+        data = b"".join(page.write() for page in pages)
+        for bufsize in [1, 10, 1000, 2 ** 16]:
+            fileobj = BytesIO(b"garbage" + data)
+            fileobj.seek(7)
+            new_pages = list(OggPage.iter_pages(fileobj, bufsize, True))
+            self.assertEqual(new_pages, pages)
+            self.assertEqual(
+                [p.offset for p in new_pages],
+                [7 + sum(p.size for p in pages[:i])
+                 for i in xrange(len(pages))])
+
+    def test_iter_pages_invalid(self):
+        data = b"".join(page.write() for page in self.pages)
+        fileobj = BytesIO(data + b"foo")
+        pages = OggPage.iter_pages(fileobj)
+        for i in xrange(3):
+            next(pages)
+        self.assertRaises(OggError, next, pages)
+
+        fileobj = BytesIO(data + b"\x00" * 100000 + data)
+        pages = OggPage.iter_pages(fileobj, 1000)
+        for i in xrange(3):
+            next(pages)
+        self.assertRaises(OggError, next, pages)
+
+        self.assertEqual(list(OggPage.iter_pages(BytesIO(b""))), [])
+
+    def test_renumber_blocks(self):
+        pages = [OggPage() for i in xrange(20)]
+        for i, page in enumerate(pages):
+            page.serial = i % 3
+            page.packets = [b"x" * i]
+        data = BytesIO(b"".join([page.write() for page in pages]))
+        block_size = ogg._RENUMBER_BLOCK_SIZE
+        # pages get split between blocks
+        ogg._RENUMBER_BLOCK_SIZE = 100
+        try:
+            OggPage.renumber(data, 1, 5)
+        finally:
+            ogg._RENUMBER_BLOCK_SIZE = block_size
+        data.seek(0)
+        new_pages = [OggPage(data) for i in xrange(20)]
+        self.assertEqual(
+            [p.sequence for p in new_pages if p.serial == 1],
+            list(xrange(5, 12)))
+        for old, new in zip(pages, new_pages):
+            if new.serial != 1:
+                self.assertEqual(old, new)
+            else:
+                self.assertEqual(old.packets, new.packets)
+                # the CRC got updated
+                data.seek(new.offset)
+                self.assertEqual(data.read(new.size), new.write())
+
+    def test_replace_resize_once(self):
+        fileobj = BytesIO()
+        old_pages = OggPage.from_packets([b"x" * 20000], default_size=1000)
+        for page in old_pages:
+            page.serial = 1
+        tail = OggPage()
+        tail.serial = 1
+        tail.sequence = old_pages[-1].sequence + 1
+        tail.packets = [b"tail"]
+        for page in old_pages + [tail]:
+            fileobj.write(page.write())
+        fileobj.seek(0)
+        old_pages = [OggPage(fileobj) for page in old_pages]
+
+        calls = []
+        old_move = _util._move
+
+        def move(*args):
+            calls.append(args)
+            return old_move(*args)
+
+        _util._move = move
+        try:
+            new_pages = OggPage.from_packets([b"y" * 40000])
+            OggPage.replace(fileobj, old_pages, new_pages)
+        finally:
+            _util._move = old_move
+        self.assertEqual(len(calls), 1)
+
+        fileobj.seek(0)
+        pages = []
+        while True:
+            try:
+                pages.append(OggPage(fileobj))
+            except EOFError:
+                break
+        self.assertEqual(
+            OggPage.to_packets(pages), [b"y" * 40000, b"tail"])
+
     def test_to_packets(self):
         self.failUnlessEqual(
             [b"foo", b"bar", b"baz"], OggPage.to_packets(self.pages))
@@ -313,6 +435,16 @@ class TOggPage(TestCase):
         self.failUnless(pages[1].continued)
         self.failUnlessEqual(OggPage.to_packets(pages), packets)
 
+    def test_from_packets_layout(self):
+        packets = [b"", b"1" * 255, b"2" * 5000, b"3" * 3, b"4" * 10000]
+        pages = OggPage.from_packets(
+            packets, default_size=1000, wiggle_room=300)
+        self.assertEqual(OggPage.to_packets(pages), packets)
+        self.assertEqual(
+            [[len(p) for p in page.packets] for page in pages],
+            [[0, 255, 765], [1530], [1530], [1175], [3, 1530], [1530],
+             [1530], [1530], [1530], [1530], [820]])
+
     def test__from_packets_try_preserve(self):
         # if the packet layout matches, just create pages with
         # the same layout and copy things over
@@ -449,6 +581,49 @@ class TOggPage(TestCase):
         self.failUnlessEqual(
             OggPage.find_last(data, pages[0].serial), pages[-2])
 
+    def test_find_last_muxed_far(self):
+        pages = [OggPage() for i in xrange(30)]
+        for i, page in enumerate(pages):
+            page.sequence = i
+            page.packets = [b"\xff" * 5000]
+        for page in pages[5:]:
+            page.serial = pages[0].serial + 1
+        data = BytesIO(b"".join([page.write() for page in pages]))
+        found = OggPage.find_last(data, pages[0].serial)
+        self.assertEqual(found, pages[4])
+        self.assertEqual(found.offset, 4 * pages[0].size)
+
+    def test_find_last_backwards_blocks(self):
+        pages = [OggPage() for i in xrange(10)]
+        for i, page in enumerate(pages):
+            page.sequence = i
+            page.packets = [b"OggS" * 100]
+        pages[-1].serial = 42
+        data = BytesIO(b"".join([page.write() for page in pages]))
+        # headers and pages get split across blocks
+        for block_size in [1, 7, 100, 500, 4096]:
+            page, invalid = OggPage._find_last_backwards(
+                data, pages[0].serial, block_size)
+            self.assertEqual(page, pages[-2])
+            self.assertEqual(page.offset, 8 * pages[0].size)
+
+    def test_find_last_bad_crc(self):
+        pages = [OggPage() for i in xrange(10)]
+        for i, page in enumerate(pages):
+            page.sequence = i
+            page.packets = [b"foo"]
+        data = [page.write() for page in pages]
+        data[-1] = data[-1][:22] + b"\x00" * 4 + data[-1][26:]
+        data = BytesIO(b"".join(data))
+        page, invalid = OggPage._find_last_backwards(data, pages[0].serial)
+        self.assertEqual(page, pages[-2])
+        self.assertTrue(invalid)
+        # all broken, reads forward ignoring the CRC
+        data = [page.write() for page in pages]
+        data = [d[:22] + b"\x00" * 4 + d[26:] for d in data]
+        data = BytesIO(b"".join(data))
+        self.assertEqual(OggPage.find_last(data, pages[0].serial), pages[-1])
+
     def test_find_last_no_serial(self):
         pages = [OggPage() for i in xrange(10)]
         for i, page in enumerate(pages):